@@ -0,0 +1,145 @@
+import os
+import time
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+from similarity import cosine_scores, top_k
+
+# - INDICE APPROSSIMATO (ANN) PER LA SIMILARITÀ DEL COSENO
+
+# Indice IVF (inverted file) in puro NumPy sulle righe tfidf ridotte con TruncatedSVD.
+# Le righe ridotte e normalizzate vengono raggruppate con KMeans in n_lists liste; una query viene confrontata
+# solo con i giochi delle n_probe liste con centroide più simile. Se a query() viene passata la matrice tfidf
+# (tfidf_matrix), i candidati vengono riordinati con il coseno esatto sulle righe tfidf originali.
+# Più n_probe è alto, più il risultato si avvicina a quello esatto.
+class IVFIndex:
+
+    def __init__(self, n_components=128, n_lists=None, n_probe=8, random_state=1):
+
+        self.n_components = n_components
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+
+    # costruzione dell'indice sulla matrice tfidf del catalogo
+    def build(self, tfidf_matrix):
+
+        n_rows, n_cols = tfidf_matrix.shape
+        n_components = max(1, min(self.n_components, n_cols - 1, n_rows - 1))
+        n_lists = self.n_lists or max(1, int(np.sqrt(n_rows)))
+
+        svd = TruncatedSVD(n_components=n_components, random_state=self.random_state)
+        self.vectors = normalize(svd.fit_transform(tfidf_matrix)).astype(np.float32)
+        self.components = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+
+        kmeans = KMeans(n_clusters=n_lists, n_init=1, random_state=self.random_state).fit(self.vectors)
+        self.centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+
+        #liste invertite: per ogni centroide, le posizioni dei giochi assegnati
+        self.order = np.argsort(kmeans.labels_, kind='stable')
+        self.bounds = np.searchsorted(kmeans.labels_[self.order], np.arange(n_lists + 1))
+        self.lists = [self.order[self.bounds[i]:self.bounds[i + 1]] for i in range(n_lists)]
+
+        return self
+
+    # restituisce le posizioni dei k giochi più simili alla riga tfidf query (escludendo la posizione exclude, se data)
+    def query(self, query_row, k=5, exclude=None, tfidf_matrix=None):
+
+        #proiezione sulle componenti della SVD (equivalente a svd.transform, senza i controlli di sklearn)
+        #solo le righe delle componenti relative ai termini presenti nella query
+        query_row = query_row.tocsr()
+        vector = query_row.data.astype(np.float32) @ self.components[query_row.indices]
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+
+        probes = np.argpartition(-(self.centroids @ vector), min(self.n_probe, len(self.lists)) - 1)[:self.n_probe]
+        candidates = np.concatenate([self.lists[p] for p in probes])
+        if exclude is not None:
+            candidates = candidates[candidates != exclude]
+
+        if tfidf_matrix is not None:
+            scores = cosine_scores(tfidf_matrix[candidates], query_row)[0]
+        else:
+            scores = self.vectors[candidates] @ vector
+
+        return candidates[top_k(scores, k=k, offset=0)].tolist()
+
+    # salvataggio degli array dell'indice in un file .npz
+    def save(self, path):
+
+        np.savez(path, components=self.components, vectors=self.vectors, centroids=self.centroids, order=self.order, bounds=self.bounds,
+                 params=np.array([self.n_components, self.n_lists or 0, self.n_probe, self.random_state]))
+
+    @staticmethod
+    def load(path):
+
+        arrays = np.load(path)
+        n_components, n_lists, n_probe, random_state = (int(x) for x in arrays['params'])
+
+        index = IVFIndex(n_components, n_lists or None, n_probe, random_state)
+        for name in ('components', 'vectors', 'centroids', 'order', 'bounds'):
+            setattr(index, name, arrays[name])
+        index.lists = [index.order[index.bounds[i]:index.bounds[i + 1]] for i in range(len(index.bounds) - 1)]
+
+        return index
+
+# Funzione che restituisce l'indice ANN per il modello tfidf dato: se esiste già su disco (accanto all'artefatto tfidf) lo carica,
+# altrimenti lo costruisce e lo salva
+def get_ann_index(model, n_components=128, n_lists=None, n_probe=8):
+
+    path = os.path.join(model['path'], f'ivf_{n_components}_{n_lists}.npz')
+    if os.path.exists(path):
+        index = IVFIndex.load(path)
+        index.n_probe = n_probe
+        return index
+
+    index = IVFIndex(n_components=n_components, n_lists=n_lists, n_probe=n_probe).build(model['matrix'])
+    index.save(path)
+
+    return index
+
+# Funzione che confronta l'indice ANN con il ranking esatto della similarità del coseno su un campione di giochi del catalogo.
+# Restituisce la recall@k media e il tempo medio per query (in millisecondi) dei due metodi, per poter scegliere il compromesso.
+def recall_report(index, tfidf_matrix, k=5, sample_size=200, rerank=True, random_state=1):
+
+    rng = np.random.default_rng(random_state)
+    sample = rng.choice(tfidf_matrix.shape[0], size=min(sample_size, tfidf_matrix.shape[0]), replace=False)
+
+    exact_time = 0.0
+    ann_time = 0.0
+    hits = 0
+    for position in sample:
+        query_row = tfidf_matrix[position]
+
+        start = time.perf_counter()
+        scores = cosine_scores(tfidf_matrix, query_row)[0]
+        scores[position] = -np.inf
+        exact = top_k(scores, k=k, offset=0)
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        approx = index.query(query_row, k=k, exclude=position, tfidf_matrix=tfidf_matrix if rerank else None)
+        ann_time += time.perf_counter() - start
+
+        #a parità di punteggio con il k-esimo risultato esatto un gioco viene considerato corretto
+        hits += min(k, int(np.sum(scores[approx] >= scores[exact[-1]])))
+
+    return {'k': k, 'n_probe': index.n_probe, 'rerank': rerank, 'queries': len(sample),
+            'recall': hits / (k * len(sample)),
+            'exact_ms': exact_time / len(sample) * 1000, 'ann_ms': ann_time / len(sample) * 1000}
+
+# Costruzione dell'indice e report della recall da riga di comando:    python ann_index.py [percorso_csv]
+if __name__ == '__main__':
+    import sys
+    from recommender_system import load_steam_data
+    from tfidf_model import get_tfidf_model
+
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'dataset/steam.csv'
+    model = get_tfidf_model(filename, load_steam_data(filename))
+    index = get_ann_index(model)
+    for n_probe in (1, 4, 8, 16):
+        index.n_probe = n_probe
+        print(recall_report(index, model['matrix']))
+        print(recall_report(index, model['matrix'], rerank=False))
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from name_index import NameIndex
+
+STEAM_CSV = 'dataset/steam.csv'
+
+# cartella degli artefatti generati (catalogo, modello tf-idf, indici)
+CACHE_DIR = 'dataset/cache'
+
+# versione del formato della cache: va incrementata quando cambia il calcolo delle colonne derivate
+CATALOGUE_VERSION = 2
+
+# colonne testuali con pochi valori distinti, salvate come categoriche
+CATEGORICAL_COLUMNS = ['developer', 'publisher', 'platforms', 'owners']
+
+# cataloghi già caricati in questa sessione, per percorso del csv
+LOADED = {}
+
+# - CATALOGO CONDIVISO
+
+# Funzione che calcola l'hash (sha1) del file csv, usato come chiave degli artefatti salvati:
+# se il dataset cambia, cambia anche la chiave e gli artefatti vengono ricostruiti.
+def file_hash(filename):
+
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+# limiti superiori (inclusi) della percentuale di voti negativi per 5, 4, 3 e 2 stelle
+STAR_BINS = [12.5, 25, 37.5, 50]
+
+# Funzione che converte il rapporto tra 'negative_ratings' e 'positive_ratings' in stelle, con un solo passaggio (np.digitize).
+# Più bassa è la percentuale dei voti negativi rispetto ai positivi, più alta è la stella:
+# [0, 12.5] = 5*;
+# (12.5, 25] = 4*;
+# (25, 37.5] = 3*;
+# (37.5, 50] = 2*;
+# (50, inf] = 1*
+# I giochi senza voti positivi (anche quelli senza nessun voto) hanno 1 stella, invece di ottenere una percentuale infinita o indefinita.
+# Restituisce un array int8.
+def star_rating(negative_ratings, positive_ratings):
+
+    negative = np.asarray(negative_ratings, dtype=np.float64)
+    positive = np.asarray(positive_ratings, dtype=np.float64)
+
+    percentage = np.full(negative.shape, np.inf)
+    np.divide(negative * 100, positive, out=percentage, where=positive > 0)
+
+    return (5 - np.digitize(percentage, STAR_BINS, right=True)).astype(np.int8)
+
+# Funzione che calcola le colonne derivate usate dai vari moduli:
+# 'star' (voto da 1 a 5, vedi star_rating) e 'positivity_quote'.
+def add_derived_columns(steam_data):
+
+    steam_data['star'] = star_rating(steam_data['negative_ratings'], steam_data['positive_ratings'])
+
+    steam_data['positivity_quote'] = steam_data['positive_ratings'] // steam_data['negative_ratings']
+
+    return steam_data
+
+# Funzione che salva il catalogo in una cache colonnare: un file .npy per ogni colonna numerica e,
+# per ogni colonna testuale, i codici interi (.npy) più la lista delle categorie (json).
+# Nel file meta.json vengono salvati l'ordine e il tipo delle colonne e mtime, dimensione e hash del csv.
+def save_catalogue(steam_data, path, source):
+
+    os.makedirs(path, exist_ok=True)
+    columns = []
+
+    for column in steam_data.columns:
+        values = steam_data[column]
+        if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            np.save(os.path.join(path, column + '.npy'), values.to_numpy())
+            columns.append({'name': column, 'kind': 'numeric'})
+        else:
+            categorical = pd.Categorical(values)
+            np.save(os.path.join(path, column + '.npy'), categorical.codes.astype(np.int32))
+            with open(os.path.join(path, column + '.json'), 'w', encoding='utf-8') as f:
+                json.dump([str(c) for c in categorical.categories], f)
+            kind = 'category' if column in CATEGORICAL_COLUMNS else 'string'
+            columns.append({'name': column, 'kind': kind})
+
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'source': source, 'columns': columns}, f)
+
+# Funzione che ricostruisce il dataframe dalla cache colonnare. Gli array numerici vengono aperti in memory-map (sola lettura),
+# le colonne in CATEGORICAL_COLUMNS restano categoriche, le altre colonne testuali vengono riportate a stringhe.
+def read_catalogue(path):
+
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+
+    data = {}
+    for column in meta['columns']:
+        name = column['name']
+        values = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+        if column['kind'] == 'numeric':
+            data[name] = values
+        else:
+            with open(os.path.join(path, name + '.json'), encoding='utf-8') as f:
+                categories = json.load(f)
+            categorical = pd.Categorical.from_codes(np.asarray(values), categories=categories)
+            data[name] = categorical if column['kind'] == 'category' else np.asarray(categorical, dtype=object)
+
+    return pd.DataFrame(data, copy=False)
+
+# Funzione che descrive il csv sorgente: mtime e dimensione servono per un controllo veloce, l'hash viene calcolato
+# solo quando mtime o dimensione cambiano (così un 'touch' senza modifiche non invalida la cache)
+def source_info(filename, previous=None):
+
+    stat = os.stat(filename)
+    info = {'mtime': stat.st_mtime, 'size': stat.st_size}
+    if previous is not None and previous.get('mtime') == info['mtime'] and previous.get('size') == info['size']:
+        info['hash'] = previous['hash']
+    else:
+        info['hash'] = file_hash(filename)
+
+    return info
+
+# Funzione che restituisce la cartella della cache colonnare del catalogo con l'hash indicato
+def catalogue_dir(source_hash, cache_dir=CACHE_DIR):
+
+    return os.path.join(cache_dir, f"catalogue_v{CATALOGUE_VERSION}_{source_hash}")
+
+# Funzione che carica il catalogo: il csv viene letto e le colonne derivate calcolate una sola volta,
+# poi il risultato viene salvato nella cache colonnare e riutilizzato (finché il csv non cambia) sia nella
+# sessione corrente sia nelle esecuzioni successive.
+def load_catalogue(filename=STEAM_CSV, cache_dir=CACHE_DIR):
+
+    stat = os.stat(filename)
+    loaded = LOADED.get(filename)
+    if loaded is not None and loaded['source']['mtime'] == stat.st_mtime and loaded['source']['size'] == stat.st_size:
+        return loaded
+
+    pointer = os.path.join(cache_dir, 'catalogue_' + os.path.basename(filename) + '.json')
+    previous = None
+    if os.path.exists(pointer):
+        with open(pointer, encoding='utf-8') as f:
+            previous = json.load(f)
+
+    source = source_info(filename, previous)
+    path = catalogue_dir(source['hash'], cache_dir)
+
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        steam_data = read_catalogue(path)
+    else:
+        steam_data = add_derived_columns(pd.read_csv(filename))
+        save_catalogue(steam_data, path, source)
+        steam_data = read_catalogue(path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(pointer, 'w', encoding='utf-8') as f:
+        json.dump(source, f)
+
+    LOADED[filename] = {'source': source, 'data': steam_data, 'name_index': None}
+
+    return LOADED[filename]
+
+# Funzione che aggiunge o aggiorna dei giochi nel catalogo senza rileggere il csv. new_rows è un dataframe con le colonne del csv:
+# le righe con un appid già presente sostituiscono quella riga (la posizione non cambia), le altre vengono aggiunte in fondo.
+# Le colonne derivate vengono calcolate solo per le nuove righe. Il csv viene aggiornato (in append se ci sono solo righe nuove),
+# la cache colonnare viene salvata con la chiave del nuovo hash e il catalogo della sessione viene sostituito
+# (la cache del catalogo precedente viene eliminata da ingest, dopo aver aggiornato gli altri artefatti).
+# Restituisce le posizioni delle righe aggiornate, quelle delle righe aggiunte e i nomi che le righe aggiornate avevano prima.
+def upsert_rows(new_rows, filename=STEAM_CSV, cache_dir=CACHE_DIR):
+
+    steam_data = load_catalogue(filename, cache_dir)['data']
+    csv_columns = [c for c in steam_data.columns if c not in ('star', 'positivity_quote')]
+    missing = [c for c in csv_columns if c not in new_rows.columns]
+    if missing:
+        raise ValueError('Colonne mancanti: ' + ', '.join(missing))
+
+    new_rows = add_derived_columns(new_rows[csv_columns].drop_duplicates('appid', keep='last').reset_index(drop=True))
+    positions = pd.Index(steam_data['appid']).get_indexer(new_rows['appid'])
+    updated = positions[positions >= 0]
+    old_names = list(steam_data['name'].iloc[updated])
+
+    #copia modificabile del catalogo (gli array della cache sono in sola lettura), con le colonne testuali come stringhe
+    steam_data = steam_data.astype({c: object for c in steam_data.columns if not pd.api.types.is_numeric_dtype(steam_data[c])})
+    for column in steam_data.columns:
+        values = steam_data[column].to_numpy(copy=True)
+        values[updated] = new_rows[column].to_numpy()[positions >= 0]
+        steam_data[column] = values
+    appended = new_rows[positions < 0]
+    steam_data = pd.concat([steam_data, appended[steam_data.columns]], ignore_index=True)
+
+    if len(updated):
+        steam_data[csv_columns].to_csv(filename, index=False)
+    else:
+        with open(filename, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+        appended[csv_columns].to_csv(filename, mode='a', header=False, index=False)
+
+    source = source_info(filename)
+    path = catalogue_dir(source['hash'], cache_dir)
+    save_catalogue(steam_data, path, source)
+    with open(os.path.join(cache_dir, 'catalogue_' + os.path.basename(filename) + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(source, f)
+    LOADED[filename] = {'source': source, 'data': read_catalogue(path), 'name_index': None}
+
+    return updated.tolist(), list(range(len(steam_data) - len(appended), len(steam_data))), old_names
+
+# Funzione che restituisce una vista del catalogo: una copia superficiale, in modo che aggiungere o sostituire colonne
+# non modifichi il catalogo condiviso (gli array numerici sono in sola lettura)
+def get_catalogue(filename=STEAM_CSV):
+
+    return load_catalogue(filename)['data'].copy(deep=False)
+
+# Funzione che restituisce l'indice dei nomi del catalogo, costruito una sola volta per catalogo caricato
+def get_name_index(filename=STEAM_CSV):
+
+    loaded = load_catalogue(filename)
+    if loaded['name_index'] is None:
+        loaded['name_index'] = NameIndex(loaded['data']['name'])
+
+    return loaded['name_index']
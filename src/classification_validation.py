@@ -1,28 +1,79 @@
+import hashlib
+import json
+import os
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    #il modulo resource non esiste su Windows: viene misurata solo la memoria allocata da Python (tracemalloc)
+    resource = None
+
+import joblib
+
 import sklearn
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.neighbors import KNeighborsClassifier
+from sklearn.neighbors import BallTree, KDTree, KNeighborsClassifier
 from sklearn.metrics import roc_auc_score
 from sklearn.metrics import classification_report
+from sklearn.metrics import accuracy_score
 from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import RandomizedSearchCV
+from sklearn.model_selection import GridSearchCV
+from sklearn.model_selection import ParameterSampler
 from sklearn.model_selection import RepeatedKFold
 
+from catalogue import CACHE_DIR, STEAM_CSV, get_catalogue, load_catalogue
 from recommender_system import get_recommendation
 
-#funzione che esegue una Randomized Search degli hyperparameters del modello scelto
-def RandomizedSearch(hyperparameters, X_train, y_train):
+#feature numeriche usate dal classificatore per predire la categoria star.
+#'appid' non viene usato: è un identificativo, non una caratteristica del gioco
+FEATURES = ['english', 'achievements', 'average_playtime', 'median_playtime', 'price']
+
+#versione del formato del modello salvato
+MODEL_VERSION = 3
+
+#numero di processi usati per la ricerca degli iperparametri (-1 = tutti i core disponibili)
+N_JOBS = -1
+
+#funzione che esegue una Randomized Search degli hyperparameters del modello scelto.
+#evaluated contiene i punteggi di cross validation delle combinazioni (n_neighbors, weights, metric) già valutate nei round precedenti:
+#vengono estratte n_iter combinazioni casuali e solo quelle nuove vengono valutate, in parallelo su n_jobs processi (candidati x fold).
+#Restituisce la migliore combinazione tra quelle estratte
+def RandomizedSearch(hyperparameters, X_train, y_train, evaluated=None, n_iter=10, n_jobs=N_JOBS, random_state=None):
+
+    evaluated = {} if evaluated is None else evaluated
+
+    candidates = [(c['n_neighbors'], c['weights'], c['metric']) for c in ParameterSampler(hyperparameters, n_iter=n_iter, random_state=random_state)]
+    new_candidates = [c for c in dict.fromkeys(candidates) if c not in evaluated]
+
+    if new_candidates:
+        knn = KNeighborsClassifier()
+
+        #utilizzo della cross validation per trovare il numero di fold
+        cvFold = RepeatedKFold(n_splits=10, n_repeats=3, random_state=1)
+        param_grid = [{'n_neighbors': [n], 'weights': [w], 'metric': [m]} for n, w, m in new_candidates]
+        search = GridSearchCV(estimator=knn, cv=cvFold, param_grid=param_grid, n_jobs=n_jobs)
 
-    knn = KNeighborsClassifier()
+        search.fit(X_train, y_train)
 
-    #utilizzo della cross validation per trovare il numero di fold
-    cvFold = RepeatedKFold(n_splits=10, n_repeats=3, random_state=1)
-    randomSearch = RandomizedSearchCV(estimator=knn, cv=cvFold, param_distributions=hyperparameters)
+        for params, score in zip(search.cv_results_['params'], search.cv_results_['mean_test_score']):
+            evaluated[(params['n_neighbors'], params['weights'], params['metric'])] = float(score)
 
-    best_model = randomSearch.fit(X_train, y_train)
+    return max(candidates, key=lambda c: evaluated[c])
 
-    return best_model
+#funzione che calcola un hash dei dati di training/test e dello spazio di ricerca, usato come chiave del risultato salvato
+def data_hash(hyperparameters, *arrays):
+
+    digest = hashlib.sha1(json.dumps(hyperparameters, sort_keys=True).encode())
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.shape, array.dtype.str)).encode())
+        digest.update(array.tobytes())
+
+    return digest.hexdigest()
 
 #funzione che valuta una serie di metriche sul modello, come accuracy, recall f1 etc...
 def modelEvaluation(y_test, y_pred, pred_prob):
@@ -36,11 +87,13 @@ def modelEvaluation(y_test, y_pred, pred_prob):
 
     return roc_score
 
-#funzione che cerca i migliori hyperparameters in assoluto, ripetendo più volte la funzione che effettua la Randomized Search
-#restituisce un dizionario contenente hyperparameters e ROC score
-def HyperparametersSearch(X_train, X_test, y_train, y_test):
+#funzione che cerca i migliori hyperparameters in assoluto, ripetendo più volte la funzione che effettua la Randomized Search.
+#Le combinazioni già valutate non vengono rivalutate, né in cross validation né sul test set.
+#Il risultato (configurazione migliore e punteggi di cross validation) viene salvato su disco con chiave l'hash dei dati:
+#le esecuzioni successive sugli stessi dati lo ricaricano e saltano la ricerca (con cache_dir=None il risultato non viene salvato).
+#restituisce una lista [n_neighbors, metric, weights, roc_score]
+def HyperparametersSearch(X_train, X_test, y_train, y_test, n_jobs=N_JOBS, cache_dir=CACHE_DIR):
 
-    result = {}
     n_neighbors = list(range(1,30))
     weights = ['uniform', 'distance']
     metric = ['euclidean', 'manhattan', 'hamming']
@@ -48,26 +101,34 @@ def HyperparametersSearch(X_train, X_test, y_train, y_test):
     #Convert to dictionary
     hyperparameters = dict(metric=metric, weights=weights, n_neighbors=n_neighbors)
 
-    i = 0
-    while i < 15:
-        best_model = RandomizedSearch(hyperparameters, X_train, y_train)
+    path = None if cache_dir is None else os.path.join(cache_dir, 'knn_search_' + data_hash(hyperparameters, X_train, X_test, y_train, y_test) + '.json')
+    if path is not None and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+        print('\nRisultato della ricerca degli iperparametri caricato da', path)
+        return saved['best']
 
-        bestweights = best_model.best_estimator_.get_params()['weights']
+    result = {}
+    evaluated = {}
+    roc_scores = {}
 
-        bestMetric = best_model.best_estimator_.get_params()['metric']
+    i = 0
+    while i < 15:
+        best = RandomizedSearch(hyperparameters, X_train, y_train, evaluated, n_jobs=n_jobs)
 
-        bestNeighbours = best_model.best_estimator_.get_params()['n_neighbors']
+        if best not in roc_scores:
+            bestNeighbours, bestweights, bestMetric = best
 
-        knn = KNeighborsClassifier(n_neighbors=bestNeighbours, weights=bestweights, algorithm='auto', metric=bestMetric, metric_params=None, n_jobs=None)
+            knn = KNeighborsClassifier(n_neighbors=bestNeighbours, weights=bestweights, algorithm='auto', metric=bestMetric, metric_params=None, n_jobs=n_jobs)
 
-        knn.fit(X_train,y_train)
+            knn.fit(X_train,y_train)
 
-        pred_prob = knn.predict_proba(X_test)
+            pred_prob = knn.predict_proba(X_test)
 
-        #valutiamo il nostro modello
-        roc_score = roc_auc_score(y_test, pred_prob, multi_class='ovr')#con star come target
+            #valutiamo il nostro modello
+            roc_scores[best] = roc_auc_score(y_test, pred_prob, multi_class='ovr')#con star come target
 
-        result[i] = {'n_neighbors' : bestNeighbours, 'metric' : bestMetric, 'weights' : bestweights, 'roc_score' : roc_score} #fallo diventare un dataframe
+        result[i] = {'n_neighbors' : best[0], 'metric' : best[2], 'weights' : best[1], 'roc_score' : roc_scores[best]} #fallo diventare un dataframe
         i += 1
 
     result = dict(sorted(result.items(), key = lambda x: x[1]['roc_score'], reverse=True))
@@ -75,6 +136,16 @@ def HyperparametersSearch(X_train, X_test, y_train, y_test):
     first_el = list(result.keys())[0]
 
     result = list(result[first_el].values())
+
+    if path is None:
+        return result
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'best': result,
+                   'cv_scores': [{'n_neighbors': n, 'weights': w, 'metric': m, 'cv_score': score} for (n, w, m), score in evaluated.items()],
+                   'roc_scores': [{'n_neighbors': n, 'weights': w, 'metric': m, 'roc_score': score} for (n, w, m), score in roc_scores.items()]}, f, indent=1)
+
     return result
 
 #funzione che cerca le migliori statistiche da applicare al modello scelto, valutando la performance man mano
@@ -137,33 +208,21 @@ def SearchingBestModelStats(X_train, X_test, y_train, y_test):
 
     return knn
 
-#funzione main che gestisce la creazione dei dataset di training e test, li trasforma ed esegue predizione su nuovi dati passati
-def main_recommender():
-    steam_data = pd.read_csv('dataset/steam.csv')
+#funzione che prepara i dati del classificatore dal catalogo: le feature numeriche e la categoria star come target
+def build_knn_data(steam_data, features=FEATURES):
 
-    #creiamo le categoria star
-    steam_data['star'] = (steam_data['negative_ratings'] / steam_data['positive_ratings']) * 100
+    x = steam_data[features].copy()
 
-    #assegniamo i dati alla sezione corretta
-    steam_data.loc[(steam_data['star'] >= 0) & (steam_data['star'] <= 12.5), ['star']] = 5
-    steam_data.loc[(steam_data['star'] > 12.5) & (steam_data['star'] <= 25), ['star']] = 4
-    steam_data.loc[(steam_data['star'] > 25) & (steam_data['star'] <= 37.5), ['star']] = 3
-    steam_data.loc[(steam_data['star'] > 37.5) & (steam_data['star'] <= 50), ['star']] = 2
-    steam_data.loc[(steam_data['star'] > 50), ['star']] = 1
-
-    steam_data['genres'] = steam_data['steamspy_tags']
+    y = steam_data['star'].values
 
-    knn_data = steam_data[['appid', 'english', 'achievements', 'star','average_playtime','median_playtime', 'price']].copy()
-
-    x = knn_data.drop(columns=['star'])
-
-    y = knn_data['star'].values
-
-    games_index = get_recommendation()
+    return x, y
 
-    recommend_data = steam_data[['name','genres','developer','price', 'star']].iloc[games_index]
+#funzione di training: gestisce la creazione dei dataset di training e test, li trasforma, cerca il modello migliore
+#e salva scaler e knn (joblib) insieme ai metadati, con chiave l'hash del catalogo. Restituisce il percorso del modello
+def train_star_classifier(filename=STEAM_CSV, cache_dir=CACHE_DIR):
 
-    predict_data = steam_data[['appid', 'english', 'achievements','average_playtime','median_playtime', 'price']].iloc[games_index]
+    steam_data = get_catalogue(filename)
+    x, y = build_knn_data(steam_data)
 
     #splittiamo il dataset in due parti, training e test, con una ratio di 80% training e 20% test
     X_train, X_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=1, stratify=y)
@@ -172,17 +231,231 @@ def main_recommender():
     scaler = StandardScaler()
     X_train = scaler.fit_transform(X_train)
     X_test = scaler.transform(X_test)
-    predict_data = scaler.transform(predict_data)
 
-    #creiamo il nuovo modello usando gli hyperparameters nuovi e ottimali trovati
+    #creiamo il nuovo modello usando gli hyperparameters nuovi e ottimali trovati (è già allenato sulla parte di training)
     knn = SearchingBestModelStats(X_train, X_test, y_train, y_test)
 
-    #alleniamo il modello sulla parte di training
-    knn.fit(X_train,y_train)
+    #albero dei vicini costruito una volta sui dati di training e salvato insieme al modello
+    tree = build_neighbour_tree(X_train, knn.metric, knn.leaf_size)
+
+    metadata = {'features': FEATURES, 'params': knn.get_params(), 'catalogue_hash': load_catalogue(filename, cache_dir)['source']['hash'],
+                'trained_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'sklearn_version': sklearn.__version__,
+                'roc_score': roc_auc_score(y_test, knn.predict_proba(X_test), multi_class='ovr')}
+
+    path = model_path(filename, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    joblib.dump({'scaler': scaler, 'knn': knn, 'tree': tree, 'y_train': np.searchsorted(knn.classes_, y_train), 'metadata': metadata}, path)
+
+    return path
+
+#funzione che restituisce il percorso del modello salvato relativo al catalogo
+def model_path(filename=STEAM_CSV, cache_dir=CACHE_DIR):
+
+    return os.path.join(cache_dir, f"star_classifier_v{MODEL_VERSION}_" + load_catalogue(filename, cache_dir)['source']['hash'] + '.joblib')
+
+#funzione che carica il modello salvato (scaler, knn e metadati); se non esiste ancora per questo catalogo lo allena
+def load_star_classifier(filename=STEAM_CSV, cache_dir=CACHE_DIR):
+
+    path = model_path(filename, cache_dir)
+    if not os.path.exists(path):
+        train_star_classifier(filename, cache_dir)
 
-    #facciamo predizioni su dati nuovi
-    predizione_star = knn.predict(predict_data)
+    return joblib.load(path)
 
-    recommend_data['star_prediction'] = predizione_star
+#funzione che costruisce l'albero per la ricerca dei vicini: KDTree se la metrica è supportata (euclidean, manhattan),
+#altrimenti BallTree (ad esempio per hamming)
+def build_neighbour_tree(X_train, metric, leaf_size=30):
+
+    if metric in KDTree.valid_metrics:
+        return KDTree(X_train, leaf_size=leaf_size, metric=metric)
+
+    return BallTree(X_train, leaf_size=leaf_size, metric=metric)
+
+#funzione di inferenza che cerca i vicini una sola volta per tutto il blocco di query (già scalate) sull'albero salvato
+#e ricava da quell'unica ricerca sia le probabilità sia le etichette, come predict_proba e predict del knn
+def predict_with_proba(model, X):
+
+    knn = model['knn']
+    distances, indices = model['tree'].query(X, k=knn.n_neighbors)
+    labels = model['y_train'][indices]
+
+    if knn.weights == 'distance':
+        #come in sklearn: se una query coincide con dei punti di training contano solo quelli
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / distances
+        exact = np.isinf(weights)
+        weights[exact.any(axis=1)] = exact[exact.any(axis=1)]
+    else:
+        weights = np.ones_like(distances)
+
+    proba = np.zeros((len(X), len(knn.classes_)))
+    np.add.at(proba, (np.repeat(np.arange(len(X)), labels.shape[1]), labels.ravel()), weights.ravel())
+    proba /= proba.sum(axis=1, keepdims=True)
+
+    return knn.classes_[proba.argmax(axis=1)], proba
+
+#funzione che aggiunge dei campioni (feature non ancora scalate e categoria star) al modello salvato senza rifare la ricerca
+#degli iperparametri: i campioni vengono scalati con lo scaler esistente, il knn viene riallenato con gli stessi parametri
+#e l'albero dei vicini ricostruito su tutti i dati di training. Restituisce il modello aggiornato
+def add_training_samples(model, X, y):
+
+    knn = model['knn']
+    X_train = np.vstack([np.asarray(model['tree'].data), model['scaler'].transform(X)])
+    y_train = np.concatenate([knn.classes_[model['y_train']], np.asarray(y)])
+
+    knn = KNeighborsClassifier(**knn.get_params()).fit(X_train, y_train)
+    model.update({'knn': knn, 'tree': build_neighbour_tree(X_train, knn.metric, knn.leaf_size),
+                  'y_train': np.searchsorted(knn.classes_, y_train)})
+    model['metadata']['added_samples'] = model['metadata'].get('added_samples', 0) + len(X)
+
+    return model
+
+#funzione di inferenza: predice la categoria star dei giochi del catalogo nelle posizioni games_index con il modello caricato
+def predict_stars(model, games_index, filename=STEAM_CSV):
+
+    predict_data = get_catalogue(filename)[model['metadata']['features']].iloc[games_index]
+
+    labels, proba = predict_with_proba(model, model['scaler'].transform(predict_data))
+
+    return labels
+
+#funzione che confronta la latenza per query del percorso attuale (knn.predict + knn.predict_proba, due ricerche dei vicini)
+#con quella della ricerca unica sull'albero salvato, su blocchi di batch_size giochi del catalogo.
+#Restituisce i tempi medi per query (in millisecondi) e la percentuale di predizioni uguali
+def benchmark_inference(model, filename=STEAM_CSV, batch_size=5, n_batches=50, random_state=1):
+
+    steam_data = get_catalogue(filename)
+    rng = np.random.default_rng(random_state)
+    X = model['scaler'].transform(steam_data[model['metadata']['features']])
+
+    current = 0.0
+    single_pass = 0.0
+    agreement = 0
+    for _ in range(n_batches):
+        batch = X[rng.choice(len(X), size=batch_size, replace=False)]
+
+        start = time.perf_counter()
+        y_pred = model['knn'].predict(batch)
+        model['knn'].predict_proba(batch)
+        current += time.perf_counter() - start
+
+        start = time.perf_counter()
+        labels, proba = predict_with_proba(model, batch)
+        single_pass += time.perf_counter() - start
+
+        agreement += int(np.sum(labels == y_pred))
+
+    queries = batch_size * n_batches
+    return {'tree': type(model['tree']).__name__, 'batch_size': batch_size, 'queries': queries,
+            'current_ms': current / queries * 1000, 'single_pass_ms': single_pass / queries * 1000,
+            'agreement': agreement / queries}
+
+#funzione main: ottiene la raccomandazione e predice la categoria star dei giochi raccomandati con il modello già allenato
+def main_recommender():
+    #il catalogo contiene già la categoria star
+    steam_data = get_catalogue()
+
+    steam_data['genres'] = steam_data['steamspy_tags']
+
+    games_index = get_recommendation()
+
+    recommend_data = steam_data[['name','genres','developer','price', 'star']].iloc[games_index]
+
+    #carichiamo il modello allenato (viene allenato solo la prima volta) e facciamo predizioni sui giochi raccomandati
+    model = load_star_classifier()
+    print('\nModello caricato (allenato il', model['metadata']['trained_at'], ')')
+
+    recommend_data['star_prediction'] = predict_stars(model, games_index)
 
     print("\nEcco a te i 5 giochi più simili a quello proposto con una predizione sulla categoria star:",recommend_data, '\n')
+
+#pipeline di valutazione non interattiva: split stratificato, scaling, ricerca degli iperparametri, fit e predizione,
+#con le feature indicate. Misura il tempo di ogni fase (load, scale, search, fit, predict), il tempo totale e, se track_memory=True,
+#il picco di memoria, e restituisce un dizionario serializzabile in JSON con ROC, accuratezza e tempi.
+#La memoria dei processi worker di joblib non sarebbe visibile né a tracemalloc né al picco RSS del processo, quindi con
+#track_memory=True la ricerca viene eseguita con n_jobs=1 (i tempi sono quelli sequenziali): peak_memory_mb è il picco delle
+#allocazioni di Python e NumPy (tracemalloc), peak_rss_mb il picco della memoria residente del processo (resource.getrusage).
+#La ricerca non usa la cache su disco, così il tempo misurato è sempre quello reale
+def evaluation_pipeline(features=FEATURES, filename=STEAM_CSV, n_jobs=N_JOBS, track_memory=True):
+
+    if track_memory:
+        n_jobs = 1
+        tracemalloc.start()
+    try:
+        report = run_evaluation(features, filename, n_jobs)
+        if track_memory:
+            report['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            if resource is not None:
+                #ru_maxrss è in kilobyte su Linux
+                report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    finally:
+        if track_memory:
+            tracemalloc.stop()
+
+    report['n_jobs'] = n_jobs
+
+    return report
+
+#fasi della pipeline di valutazione (vedi evaluation_pipeline)
+def run_evaluation(features, filename, n_jobs):
+
+    timings = {}
+    total = time.perf_counter()
+
+    start = time.perf_counter()
+    x, y = build_knn_data(get_catalogue(filename), list(features))
+    timings['load'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    X_train, X_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=1, stratify=y)
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X_train)
+    X_test = scaler.transform(X_test)
+    timings['scale'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bestNeighbours, bestMetric, bestweights, search_roc = HyperparametersSearch(X_train, X_test, y_train, y_test, n_jobs=n_jobs, cache_dir=None)
+    timings['search'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    knn = KNeighborsClassifier(n_neighbors=bestNeighbours, weights=bestweights, algorithm='auto', metric=bestMetric)
+    knn.fit(X_train, y_train)
+    tree = build_neighbour_tree(X_train, bestMetric, knn.leaf_size)
+    timings['fit'] = time.perf_counter() - start
+
+    #una sola ricerca dei vicini per tutto il test set
+    start = time.perf_counter()
+    y_pred, pred_prob = predict_with_proba({'knn': knn, 'tree': tree, 'y_train': np.searchsorted(knn.classes_, y_train)}, X_test)
+    timings['predict'] = time.perf_counter() - start
+
+    report = {'features': list(features), 'n_train': len(X_train), 'n_test': len(X_test),
+              'params': {'n_neighbors': int(bestNeighbours), 'metric': bestMetric, 'weights': bestweights},
+              'roc_score': float(roc_auc_score(y_test, pred_prob, multi_class='ovr')),
+              'accuracy': float(accuracy_score(y_test, y_pred)),
+              'timings': timings, 'predict_ms_per_query': timings['predict'] / len(X_test) * 1000,
+              'wall_time': time.perf_counter() - total}
+
+    return report
+
+# Training del modello da riga di comando:    python classification_validation.py [percorso_csv]
+# Benchmark dell'inferenza:                  python classification_validation.py [percorso_csv] --benchmark
+# Valutazione (JSON):                        python classification_validation.py [percorso_csv] --evaluate [--features=a,b,c] [--output=file.json] [--no-memory]
+if __name__ == '__main__':
+    import sys
+
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    options = dict(a[2:].split('=', 1) if '=' in a else (a[2:], '') for a in sys.argv[1:] if a.startswith('--'))
+    filename = args[0] if args else STEAM_CSV
+    if 'evaluate' in options:
+        features = options['features'].split(',') if options.get('features') else FEATURES
+        report = json.dumps(evaluation_pipeline(features, filename, track_memory='no-memory' not in options), indent=1)
+        if options.get('output'):
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(report)
+        print(report)
+    elif 'benchmark' in options:
+        model = load_star_classifier(filename)
+        for batch_size in (1, 5, 100):
+            print(benchmark_inference(model, filename, batch_size=batch_size))
+    else:
+        print('\nModello salvato in:', train_star_classifier(filename))
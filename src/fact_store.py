@@ -0,0 +1,377 @@
+import gc
+import pickle
+from bisect import bisect_left
+import re
+import sys
+from collections import OrderedDict
+from itertools import count
+
+import numpy as np
+
+# - FACT STORE INDICIZZATO
+
+# Un termine è una variabile se inizia con una lettera maiuscola oppure con '_'
+def is_variable(term):
+
+    return isinstance(term, str) and term != '' and (term[0].isupper() or term[0] == '_')
+
+# termine tra doppi apici (con \" e \\ come sequenze di escape) oppure termine senza virgole
+QUOTED_TERM = re.compile(r'"((?:[^"\\]|\\.)*)"|([^,"]+)')
+
+# Funzione che racchiude un atomo tra doppi apici, così può contenere virgole (es. il nome 'warhammer40,000:...')
+def quote_term(term):
+
+    return '"' + term.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+# Funzione che scompone un'espressione 'predicato(t1, t2, ...)' nel predicato e nella tupla dei termini.
+# Come pytholog, gli spazi vengono rimossi e la parentesi di chiusura può mancare.
+# I termini tra doppi apici (vedi quote_term) vengono presi per intero, senza apici.
+def parse_expr(expr):
+
+    expr = expr.replace(' ', '')
+    if '(' not in expr:
+        return expr, ()
+    predicate, terms = expr.split('(', 1)
+    terms = terms.translate(str.maketrans('', '', '()'))
+
+    if '"' in terms:
+        return predicate, tuple(sys.intern(re.sub(r'\\(.)', r'\1', m.group(1)) if m.group(1) is not None else m.group(2))
+                                for m in QUOTED_TERM.finditer(terms))
+
+    return predicate, tuple(sys.intern(t) for t in terms.split(','))
+
+# Funzione che scompone una regola 'testa :- goal1, goal2, ...' nella testa e nella lista dei goal del corpo
+def parse_rule(rule):
+
+    head, body = rule.replace(' ', '').split(':-', 1)
+    goals = re.findall(r'\w+\([^)]*\)', body)
+
+    return parse_expr(head), [parse_expr(goal) for goal in goals]
+
+# Knowledge base che sostituisce la ricerca lineare di pytholog per fatti e regole senza aritmetica.
+# Per ogni predicato mantiene la lista dei fatti (tuple di termini) e un indice hash per ogni posizione degli argomenti
+# (valore -> posizioni dei fatti), così un goal con almeno un argomento noto viene risolto con una ricerca nel dizionario,
+# in entrambe le direzioni delle regole come has_price(X, Y) :- prices(Y, X).
+# Si usa come pytholog.KnowledgeBase: kb(lista_di_fatti_e_regole) e kb.query('predicato(Termini)') (o pl.Expr(...)),
+# che restituisce una lista di dizionari {variabile: valore}, oppure ['Yes']/['No'] per le query senza variabili.
+# Le risposte vengono memorizzate in una cache LRU di al massimo cache_size query (le risposte con più di
+# cache_max_answers elementi non vengono memorizzate); la cache viene svuotata quando si aggiungono fatti o regole.
+class FactStore:
+
+    def __init__(self, name=None, cache_size=1024, cache_max_answers=1000):
+
+        self.name = name
+        self.facts = {}
+        self.indexes = {}
+        self.rules = {}
+        # numero di fatti rimossi (None nella lista dei fatti) per predicato
+        self.removed = {}
+
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_max_answers = cache_max_answers
+        self.hits = 0
+        self.misses = 0
+
+        # contatore delle applicazioni delle regole: ogni applicazione rinomina le variabili della regola con un id nuovo
+        self.applications = count()
+
+        # indici ordinati sui valori numerici, costruiti alla prima richiesta: (predicato, posizione) -> (valori, fatti)
+        self.sorted_indexes = {}
+
+    def __call__(self, knowledge):
+
+        self.add_kn(knowledge)
+
+    def __str__(self):
+
+        return "FactStore: " + str(self.name)
+
+    __repr__ = __str__
+
+    # aggiunge una lista di fatti e regole scritti in stile Prolog
+    def add_kn(self, knowledge):
+
+        self.clear_cache()
+        for entry in knowledge:
+            if ':-' in entry:
+                head, body = parse_rule(entry)
+                self.rules.setdefault(head[0], []).append((head[1], body))
+            else:
+                predicate, terms = parse_expr(entry)
+                self.add_fact(predicate, terms)
+
+    # aggiunge un fatto già scomposto, aggiornando gli indici di ogni posizione
+    def add_fact(self, predicate, terms):
+
+        self.clear_cache()
+        facts = self.facts.setdefault(predicate, [])
+        indexes = self.indexes.setdefault(predicate, [])
+        while len(indexes) < len(terms):
+            indexes.append({})
+
+        position = len(facts)
+        facts.append(terms)
+        for i, term in enumerate(terms):
+            indexes[i].setdefault(term, []).append(position)
+
+    # caricamento in blocco: aggiunge i fatti predicate(a1, a2, ...) prendendo gli argomenti da sequenze parallele già
+    # normalizzate (ad esempio colonne di un dataframe), senza passare da stringhe da riparsare. I termini vengono internati
+    # e gli indici costruiti in un solo passaggio per posizione.
+    def add_facts(self, predicate, *columns):
+
+        self.clear_cache()
+        new_facts = [tuple(sys.intern(term) for term in fact) for fact in zip(*columns)]
+
+        facts = self.facts.setdefault(predicate, [])
+        indexes = self.indexes.setdefault(predicate, [])
+        while len(indexes) < len(columns):
+            indexes.append({})
+
+        start = len(facts)
+        facts.extend(new_facts)
+        for i, index in enumerate(indexes[:len(columns)]):
+            for position, fact in enumerate(new_facts, start):
+                index.setdefault(fact[i], []).append(position)
+
+    # rimuove i fatti del predicato il cui argomento in posizione position è uno dei valori indicati.
+    # I fatti rimossi restano come None nella lista (le posizioni degli altri fatti non cambiano) e le loro posizioni vengono
+    # tolte solo dai bucket degli indici che le contengono e dagli indici ordinati già costruiti, senza ricostruire gli indici.
+    # Restituisce il numero di fatti rimossi.
+    def remove_facts(self, predicate, values, position=0):
+
+        self.cache.clear()
+        facts = self.facts.get(predicate, [])
+        indexes = self.indexes.get(predicate, [])
+        if position >= len(indexes):
+            return 0
+
+        removed = []
+        for value in set(values):
+            removed.extend(indexes[position].pop(value, []))
+
+        for p in removed:
+            for i, term in enumerate(facts[p]):
+                if i == position:
+                    continue
+                #i bucket sono ordinati per posizione (i fatti vengono solo aggiunti in coda)
+                bucket = indexes[i][term]
+                del bucket[bisect_left(bucket, p)]
+                if not bucket:
+                    del indexes[i][term]
+            facts[p] = None
+
+        if removed:
+            self.removed[predicate] = self.removed.get(predicate, 0) + len(removed)
+            for key, (sorted_values, order) in list(self.sorted_indexes.items()):
+                if key[0] == predicate:
+                    keep = ~np.isin(order, removed)
+                    self.sorted_indexes[key] = (sorted_values[keep], order[keep])
+
+        return len(removed)
+
+    # salva fatti, regole e indici in un file snapshot
+    def save(self, path):
+
+        with open(path, 'wb') as f:
+            pickle.dump({'name': self.name, 'facts': self.facts, 'indexes': self.indexes, 'rules': self.rules, 'removed': self.removed}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # ricrea la knowledge base da un file snapshot, senza ricostruire gli indici.
+    # Il garbage collector viene sospeso durante il caricamento, che crea moltissimi piccoli oggetti.
+    @staticmethod
+    def load(path):
+
+        gc.disable()
+        try:
+            with open(path, 'rb') as f:
+                snapshot = pickle.load(f)
+        finally:
+            gc.enable()
+
+        store = FactStore(snapshot['name'])
+        store.facts = snapshot['facts']
+        store.indexes = snapshot['indexes']
+        store.rules = snapshot['rules']
+        store.removed = snapshot.get('removed', {})
+
+        return store
+
+    # numero di fatti memorizzati (per predicato, se indicato)
+    def fact_count(self, predicate=None):
+
+        if predicate is not None:
+            return len(self.facts.get(predicate, [])) - self.removed.get(predicate, 0)
+
+        return sum(len(facts) for facts in self.facts.values()) - sum(self.removed.values())
+
+    # svuota la cache delle query e gli indici ordinati, che non sono più validi dopo l'aggiunta di fatti
+    def clear_cache(self):
+
+        self.cache.clear()
+        self.sorted_indexes.clear()
+
+    # indice ordinato sul valore numerico dell'argomento in posizione position dei fatti del predicato:
+    # restituisce i valori in ordine crescente e le posizioni dei fatti corrispondenti (i valori non numerici vengono esclusi)
+    def sorted_index(self, predicate, position=1):
+
+        key = (predicate, position)
+        if key not in self.sorted_indexes:
+            facts = self.facts.get(predicate, [])
+            values = np.array([to_number(fact[position]) if fact is not None and len(fact) > position else np.nan for fact in facts], dtype=np.float64)
+            valid = np.flatnonzero(~np.isnan(values))
+            order = valid[np.argsort(values[valid], kind='stable')]
+            self.sorted_indexes[key] = (values[order], order)
+
+        return self.sorted_indexes[key]
+
+    # generatore (pigro) dei fatti del predicato il cui argomento numerico è compreso tra low e high (estremi inclusi,
+    # None = nessun limite), in ordine crescente di valore o decrescente con descending=True.
+    # Gli estremi vengono trovati con una ricerca binaria sull'indice ordinato.
+    def range_facts(self, predicate, low=None, high=None, position=1, descending=False):
+
+        values, order = self.sorted_index(predicate, position)
+        first = 0 if low is None else np.searchsorted(values, low, side='left')
+        last = len(values) if high is None else np.searchsorted(values, high, side='right')
+
+        positions = order[first:last]
+        if descending:
+            positions = positions[::-1]
+
+        facts = self.facts[predicate] if predicate in self.facts else []
+        return (facts[p] for p in positions)
+
+    # statistiche della cache delle query
+    def cache_info(self):
+
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.cache), 'maxsize': self.cache_size}
+
+    # risolve una query e restituisce le risposte nel formato di pytholog, servendole dalla cache se già calcolate
+    def query(self, expr):
+
+        if isinstance(expr, str):
+            predicate, terms = parse_expr(expr)
+        else:
+            predicate, terms = expr.predicate, tuple(expr.terms)
+
+        key = (predicate, terms)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return [dict(a) if isinstance(a, dict) else a for a in self.cache[key]]
+
+        self.misses += 1
+        answers = self.resolve(predicate, terms)
+
+        if self.cache_size > 0 and len(answers) <= self.cache_max_answers:
+            self.cache[key] = answers
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        return [dict(a) if isinstance(a, dict) else a for a in answers]
+
+    # risolve una query già scomposta, senza usare la cache
+    def resolve(self, predicate, terms):
+
+        #ogni '_' è una variabile anonima diversa
+        terms = tuple(f'_{i}' if term == '_' else term for i, term in enumerate(terms))
+        variables = [t for t in dict.fromkeys(terms) if is_variable(t) and not t.startswith('_')]
+
+        answers = []
+        for bindings in self.solve(predicate, terms, {}):
+            if variables:
+                answers.append({v: walk(v, bindings) for v in variables})
+            else:
+                answers.append('Yes')
+                break
+
+        return answers if answers else ['No']
+
+    # generatore delle sostituzioni che rendono vero il goal predicate(terms), partendo da bindings
+    def solve(self, predicate, terms, bindings):
+
+        yield from self.match_facts(predicate, terms, bindings)
+
+        for head, body in self.rules.get(predicate, []):
+            if len(head) != len(terms):
+                continue
+            #rinomino le variabili della regola con un id nuovo per ogni applicazione, per non confonderle con quelle
+            #della query né con quelle di altre applicazioni (anche della stessa regola, ad esempio in goal fratelli)
+            application = next(self.applications)
+            rename = lambda t: f'{t}#{application}' if is_variable(t) else t
+            new_bindings = unify(terms, tuple(rename(t) for t in head), bindings)
+            if new_bindings is None:
+                continue
+            goals = [(p, tuple(rename(t) for t in ts)) for p, ts in body]
+            yield from self.solve_all(goals, new_bindings)
+
+    # risolve in sequenza i goal di una congiunzione
+    def solve_all(self, goals, bindings):
+
+        if not goals:
+            yield bindings
+            return
+
+        predicate, terms = goals[0]
+        for new_bindings in self.solve(predicate, terms, bindings):
+            yield from self.solve_all(goals[1:], new_bindings)
+
+    # confronta il goal con i fatti del predicato, usando l'indice dell'argomento noto più selettivo
+    def match_facts(self, predicate, terms, bindings):
+
+        facts = self.facts.get(predicate)
+        if not facts:
+            return
+
+        resolved = tuple(walk(t, bindings) for t in terms)
+        indexes = self.indexes[predicate]
+
+        candidates = None
+        for i, term in enumerate(resolved):
+            if not is_variable(term) and i < len(indexes):
+                bucket = indexes[i].get(term, [])
+                if candidates is None or len(bucket) < len(candidates):
+                    candidates = bucket
+        if candidates is None:
+            candidates = range(len(facts))
+
+        for position in candidates:
+            fact = facts[position]
+            if fact is None or len(fact) != len(resolved):
+                continue
+            new_bindings = unify(resolved, fact, bindings)
+            if new_bindings is not None:
+                yield new_bindings
+
+# Funzione che converte un termine in numero, restituendo nan se non è numerico
+def to_number(term):
+
+    try:
+        return float(term)
+    except ValueError:
+        return np.nan
+
+# Funzione che segue la catena delle sostituzioni di una variabile fino a un valore (o a una variabile libera)
+def walk(term, bindings):
+
+    while is_variable(term) and term in bindings:
+        term = bindings[term]
+
+    return term
+
+# Funzione che unifica due tuple di termini; restituisce le nuove sostituzioni oppure None se non sono unificabili
+def unify(left, right, bindings):
+
+    bindings = dict(bindings)
+    for a, b in zip(left, right):
+        a = walk(a, bindings)
+        b = walk(b, bindings)
+        if a == b:
+            continue
+        if is_variable(a):
+            bindings[a] = b
+        elif is_variable(b):
+            bindings[b] = a
+        else:
+            return None
+
+    return bindings
@@ -0,0 +1,106 @@
+import sys
+
+import numpy as np
+
+# - VOCABOLARIO DEI GENERI E BITSET
+
+# Funzione che scompone una stringa di generi separati da ';' nei singoli tag (minuscolo, senza spazi)
+def split_tags(genres):
+
+    if not isinstance(genres, str):
+        return []
+
+    return [sys.intern(tag) for tag in genres.lower().replace(' ', '').split(';') if tag]
+
+# Funzione che conta i bit a 1 di ogni riga di una matrice di parole uint64
+def popcount(words):
+
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+
+    return np.unpackbits(words.view(np.uint8), axis=-1).sum(axis=-1, dtype=np.int64)
+
+# Vocabolario dei tag di genere: ogni tag distinto del catalogo (una sola voce per tag, invece di una per ogni combinazione
+# di generi) riceve un bit. Un gioco è rappresentato dal bitset dei suoi tag, sia come intero Python (confronto tra due giochi
+# con operazioni bit a bit in tempo costante) sia come riga di una matrice uint64 (confronto di un gioco con tutto il catalogo).
+class GenreVocabulary:
+
+    def __init__(self, genres):
+
+        self.tags = {}
+        for value in genres:
+            for tag in split_tags(value):
+                self.tags.setdefault(tag, len(self.tags))
+        self.n_words = max(1, (len(self.tags) + 63) // 64)
+        self.matrix = self.bitset_matrix(genres)
+
+    def __len__(self):
+
+        return len(self.tags)
+
+    def __contains__(self, tag):
+
+        return tag in self.tags
+
+    # restituisce il bitset (intero) dei tag conosciuti e il numero di tag non presenti nel vocabolario
+    def bitset(self, genres):
+
+        bits = 0
+        unknown = 0
+        for tag in split_tags(genres):
+            if tag in self.tags:
+                bits |= 1 << self.tags[tag]
+            else:
+                unknown += 1
+
+        return bits, unknown
+
+    # matrice (n_giochi, n_parole) uint64 con i bitset dei tag di ogni gioco
+    def bitset_matrix(self, genres):
+
+        genres = list(genres)
+        rows = []
+        bits = []
+        for row, value in enumerate(genres):
+            for tag in split_tags(value):
+                if tag in self.tags:
+                    rows.append(row)
+                    bits.append(self.tags[tag])
+
+        rows = np.asarray(rows, dtype=np.int64)
+        bits = np.asarray(bits, dtype=np.uint64)
+        matrix = np.zeros((len(genres), self.n_words), dtype=np.uint64)
+        np.bitwise_or.at(matrix, (rows, (bits // 64).astype(np.int64)), np.left_shift(np.uint64(1), bits % np.uint64(64)))
+
+        return matrix
+
+    # similarità di Jaccard tra due stringhe di generi: |A ∩ B| / |A ∪ B|.
+    # I tag non presenti nel vocabolario non possono coincidere con nessun altro, quindi contano solo nell'unione.
+    def jaccard(self, genres1, genres2):
+
+        bits1, unknown1 = self.bitset(genres1)
+        bits2, unknown2 = self.bitset(genres2)
+        union = bin(bits1 | bits2).count('1') + unknown1 + unknown2
+
+        return bin(bits1 & bits2).count('1') / union if union else 0.0
+
+    # True se le due stringhe hanno esattamente gli stessi tag, tutti presenti nel vocabolario (l'ordine dei tag non conta)
+    def same_genre(self, genres1, genres2):
+
+        bits1, unknown1 = self.bitset(genres1)
+        bits2, unknown2 = self.bitset(genres2)
+
+        return bits1 != 0 and bits1 == bits2 and unknown1 == unknown2 == 0
+
+    # similarità di Jaccard tra una stringa di generi e tutte le righe della matrice (tutti i giochi, se rows è None)
+    def jaccard_all(self, genres, rows=None):
+
+        bits, unknown = self.bitset(genres)
+        query = np.array([(bits >> (64 * w)) & 0xFFFFFFFFFFFFFFFF for w in range(self.n_words)], dtype=np.uint64)
+
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        intersection = popcount(matrix & query)
+        union = popcount(matrix | query) + unknown
+
+        return np.where(union > 0, intersection / np.maximum(union, 1), 0.0)
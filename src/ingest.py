@@ -0,0 +1,152 @@
+import os
+import shutil
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from catalogue import CACHE_DIR, STEAM_CSV, catalogue_dir, get_catalogue, load_catalogue, upsert_rows
+from classification_validation import add_training_samples, build_knn_data, model_path
+from fact_store import FactStore
+from knowledge_base import build_dataframe, kb_path, update_game_facts
+from ontology_import import import_catalogue, imported_rows
+from ontology_store import ONTOLOGY_OWL
+from recommender_system import load_steam_data
+from tfidf_model import build_tfidf_model, load_tfidf_model, model_dir, save_tfidf_model, transform_rows, vocabulary_drift
+
+# frazione massima di parole delle nuove righe assenti dal vocabolario tf-idf (misurata su sviluppatore, casa pubblicatrice,
+# piattaforme e generi, vedi vocabulary_drift): oltre questa soglia il modello viene rifatto
+DRIFT_THRESHOLD = 0.1
+
+# - AGGIORNAMENTO INCREMENTALE DEL CATALOGO
+
+# Funzione che aggiorna la matrice tfidf: se il modello del catalogo precedente esiste e il vocabolario copre abbastanza
+# le righe nuove o modificate, solo queste vengono trasformate con vocabolario e idf salvati e inserite nella matrice
+# (le righe aggiornate restano nella loro posizione); altrimenti il modello viene rifatto sull'intero catalogo.
+def update_tfidf(old_path, filename, changed, n_old, drift_threshold, cache_dir=CACHE_DIR):
+
+    steam_data = load_steam_data(filename)
+    if not os.path.exists(os.path.join(old_path, 'sq_sums.npy')):
+        return {'mode': 'skipped'}
+
+    model = load_tfidf_model(old_path)
+    rows = steam_data.iloc[changed]
+    drift = vocabulary_drift(model, rows)
+    if drift > drift_threshold:
+        build_tfidf_model(filename, steam_data, cache_dir)
+        return {'mode': 'refit', 'drift': drift}
+
+    #le righe trasformate vengono messe in coda e poi riordinate con un solo indicizzamento per righe
+    order = np.arange(len(steam_data))
+    order[changed] = n_old + np.arange(len(changed))
+    matrix = sp.vstack([model['matrix'], transform_rows(model, rows)]).tocsr()[order]
+
+    save_tfidf_model(model_dir(filename, cache_dir), model['vocabulary'], model['idf'], matrix)
+
+    return {'mode': 'incremental', 'drift': drift, 'rows': len(changed)}
+
+# Funzione che aggiorna lo snapshot della knowledge base: vengono ricreati solo i fatti dei giochi con i nomi indicati
+def update_kb(old_path, filename, names, cache_dir=CACHE_DIR):
+
+    if not os.path.exists(old_path):
+        return {'mode': 'skipped'}
+
+    steam_kb = FactStore.load(old_path)
+    removed, added = update_game_facts(steam_kb, build_dataframe(filename), names)
+    steam_kb.save(kb_path(filename, cache_dir))
+
+    return {'mode': 'incremental', 'facts_removed': removed, 'facts_added': added}
+
+# Funzione che aggiorna il classificatore delle stelle aggiungendo i nuovi giochi come campioni di training
+# (i giochi aggiornati non vengono tolti dai dati di training: per quelli serve un nuovo training)
+def update_classifier(old_path, filename, appended, cache_dir=CACHE_DIR):
+
+    if not os.path.exists(old_path):
+        return {'mode': 'skipped'}
+
+    model = joblib.load(old_path)
+    x, y = build_knn_data(get_catalogue(filename).iloc[appended], model['metadata']['features'])
+    if len(x):
+        model = add_training_samples(model, x, y)
+    joblib.dump(model, model_path(filename, cache_dir))
+
+    return {'mode': 'incremental', 'samples_added': len(x)}
+
+# Funzione che elimina gli artefatti (cartelle o file) del catalogo precedente, sostituiti da quelli aggiornati
+def remove_artifacts(paths):
+
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+# Funzione che aggiunge o aggiorna dei giochi (dataframe con le colonne del csv, identificati da 'appid') e propaga la modifica
+# agli artefatti già costruiti per il catalogo precedente, senza ricostruirli: matrice tfidf, knowledge base, classificatore
+# delle stelle e, se il catalogo vi è già stato importato, l'ontologia. Gli artefatti non ancora costruiti vengono saltati (saranno
+# costruiti alla prima richiesta). Alla fine gli artefatti del catalogo precedente vengono eliminati, così la cache non cresce
+# a ogni aggiornamento. Restituisce un report con le righe modificate e il tempo di ogni fase.
+def ingest(new_rows, filename=STEAM_CSV, cache_dir=CACHE_DIR, drift_threshold=DRIFT_THRESHOLD):
+
+    start = time.perf_counter()
+    timings = {}
+
+    #percorsi degli artefatti del catalogo precedente
+    old_tfidf = model_dir(filename, cache_dir)
+    old_kb = kb_path(filename, cache_dir)
+    old_model = model_path(filename, cache_dir)
+    old_catalogue = catalogue_dir(load_catalogue(filename, cache_dir)['source']['hash'], cache_dir)
+    n_old = len(get_catalogue(filename))
+
+    stage = time.perf_counter()
+    updated, appended, old_names = upsert_rows(new_rows, filename, cache_dir)
+    changed = updated + appended
+    names = set(old_names) | set(get_catalogue(filename)['name'].iloc[changed])
+    timings['catalogue'] = time.perf_counter() - stage
+
+    report = {'updated_rows': len(updated), 'appended_rows': len(appended), 'catalogue_rows': n_old + len(appended)}
+
+    stage = time.perf_counter()
+    report['tfidf'] = update_tfidf(old_tfidf, filename, changed, n_old, drift_threshold, cache_dir)
+    timings['tfidf'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    report['kb'] = update_kb(old_kb, filename, names, cache_dir)
+    timings['kb'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    report['classifier'] = update_classifier(old_model, filename, appended, cache_dir)
+    timings['classifier'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    #l'ontologia viene aggiornata solo se il catalogo vi è già stato importato (non basta che il quadstore esista)
+    if os.path.exists(ONTOLOGY_OWL) and imported_rows(ONTOLOGY_OWL, cache_dir) > 0:
+        ontology = import_catalogue(filename, cache_dir=cache_dir)
+        report['ontology'] = {'mode': 'incremental', 'rows': ontology['imported_rows']}
+    else:
+        report['ontology'] = {'mode': 'skipped'}
+    timings['ontology'] = time.perf_counter() - stage
+
+    #gli artefatti con la chiave del nuovo hash sono stati scritti: quelli del catalogo precedente non servono più
+    old_artifacts = [old_catalogue, old_tfidf, old_kb, old_model]
+    new_artifacts = {catalogue_dir(load_catalogue(filename, cache_dir)['source']['hash'], cache_dir),
+                     model_dir(filename, cache_dir), kb_path(filename, cache_dir), model_path(filename, cache_dir)}
+    remove_artifacts([path for path in old_artifacts if path not in new_artifacts])
+
+    report['timings'] = timings
+    report['seconds'] = time.perf_counter() - start
+
+    return report
+
+# Aggiornamento da riga di comando:    python ingest.py nuovi_giochi.csv [percorso_csv] [--drift=0.1]
+if __name__ == '__main__':
+    import json
+    import sys
+
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    options = dict(a[2:].split('=', 1) if '=' in a else (a[2:], '') for a in sys.argv[1:] if a.startswith('--'))
+    report = ingest(pd.read_csv(args[0]), args[1] if len(args) > 1 else STEAM_CSV,
+                    drift_threshold=float(options.get('drift') or DRIFT_THRESHOLD))
+    print(json.dumps(report, indent=1))
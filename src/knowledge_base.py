@@ -1,35 +1,30 @@
-import pytholog as pl
+import os
+import time
+from itertools import islice
+
+import numpy as np
 import pandas as pd
 
+from catalogue import CACHE_DIR, STEAM_CSV, get_catalogue, get_name_index, load_catalogue
+from fact_store import FactStore, quote_term
+from genre_tags import GenreVocabulary
+
+# versione del formato dello snapshot della knowledge base: va incrementata quando cambiano i fatti o le regole di populate_kb
+KB_SNAPSHOT_VERSION = 2
+
 # - DATAFRAME
 
-# Funziona che costruisce il dataframe basato sul dataset steam.csv.
-# Aggiunge una nuova colonna 'star', in cui converte i valori del rapporto tra 'negative_ratings' e
-# 'positive_ratings' in delle stelle che rappresentanto il voto dato al gioco dagli utenti.
+# Funziona che costruisce il dataframe basato sul catalogo condiviso (steam.csv).
+# La colonna 'star', che converte i valori del rapporto tra 'negative_ratings' e 'positive_ratings'
+# in delle stelle che rappresentanto il voto dato al gioco dagli utenti, è già calcolata nel catalogo.
 # Converte la colonna 'english' in stringhe.
-def build_dataframe():
-
-    # creo il dataframe
-    steam_data = pd.read_csv("dataset/steam.csv")
-
-    # creo una nuova colonna 'star', che avrà come valori la percentuale dei 'negative_ratings'
-    # in rapporto ai 'positive_ratings'
-    steam_data['star'] = (steam_data['negative_ratings'] / steam_data['positive_ratings']) * 100
-    # converto 'star' in dei range rappresentati dalle stelle
-    # più basso è il valore della percentuale, più alta è la stella
-    # [0, 12.5] = 5*;
-    # [12.6, 25] = 4*;
-    # [25.1, 37.5] = 3*;
-    # [37.6, 50] = 2*;
-    # [50, inf] = 1*
-    steam_data.loc[(steam_data['star'] >= 0) & (steam_data['star'] <= 12.5), ['star']] = 5
-    steam_data.loc[(steam_data['star'] > 12.5) & (steam_data['star'] <= 25), ['star']] = 4
-    steam_data.loc[(steam_data['star'] > 25) & (steam_data['star'] <= 37.5), ['star']] = 3
-    steam_data.loc[(steam_data['star'] > 37.5) & (steam_data['star'] <= 50), ['star']] = 2
-    steam_data.loc[(steam_data['star'] > 50), ['star']] = 1
+def build_dataframe(filename=STEAM_CSV):
+
+    # prendo il catalogo (il csv viene letto una sola volta)
+    steam_data = get_catalogue(filename)
+
     # converto i valori "0" e "1" di 'english' nelle string "no" e "yes"
-    steam_data.loc[(steam_data['english'] == 0), ['english']] = 'no'
-    steam_data.loc[(steam_data['english'] == 1), ['english']] = 'yes'
+    steam_data['english'] = steam_data['english'].map({0: 'no', 1: 'yes'})
 
     # creo una copia del dataframe con all'interno solo le colonne d'interesse
     steam_data = steam_data[['name','developer','publisher','english','star','steamspy_tags','price','average_playtime','genres']].copy()
@@ -38,52 +33,60 @@ def build_dataframe():
 
 # - KNOWLEDGE BASE
 
+# Funzione che converte una colonna del dataframe negli atomi usati nella knowledge base:
+# stringhe in minuscolo senza spazi e parentesi, come li scriverebbe il parser delle query.
+def to_atoms(column):
+
+    return column.astype(str).str.lower().str.replace(r'[\s()]', '', regex=True)
+
+# predicato e colonna del dataframe usata come secondo argomento (il primo è sempre il nome del gioco):
+# developer('name', 'developer')        fatti riguardanti gli sviluppattori dei giochi
+# publisher('name', 'publisher')        fatti riguardanti chi ha pubblicato i giochi
+# prices('name', 'price')               fatti riguardanti i prezzi dei giochi
+# stars('name', 'star')                 fatti riguardanti i ratings in stelle dei giochi
+# genre('name', 'steamspy_tags')        fatti riguardanti i generi dei giochi
+# english('name', 'english')            fatti che ci dicono se un gioco è in inglese o meno
+# avg_playtime('name', 'average_playtime')  fatti riguardanti il tempo di gioco medio
+GAME_FACTS = [('developer', 'developer'), ('publisher', 'publisher'), ('prices', 'price'),
+              ('stars', 'star'), ('genre', 'steamspy_tags'), ('english', 'english'),
+              ('avg_playtime', 'average_playtime')]
+
+# Funzione che aggiunge alla knowledge base i fatti dei giochi del dataframe (senza duplicati), colonna per colonna
+def add_game_facts(steam_kb, dataframe):
+
+    names = to_atoms(dataframe['name'])
+    for predicate, column in GAME_FACTS:
+        data = pd.DataFrame({'name': names, 'value': to_atoms(dataframe[column])}).drop_duplicates()
+        steam_kb.add_facts(predicate, data['name'], data['value'])
+
+# Funzione che aggiorna i fatti dei giochi con i nomi indicati: i loro fatti vengono rimossi e ricreati dalle righe
+# del dataframe con quei nomi (così i giochi con lo stesso nome restano tutti presenti e senza duplicati).
+# Restituisce il numero di fatti rimossi e aggiunti.
+def update_game_facts(steam_kb, dataframe, names):
+
+    atoms = set(to_atoms(pd.Series(list(names), dtype=object)))
+    before = steam_kb.fact_count()
+    removed = sum(steam_kb.remove_facts(predicate, atoms) for predicate, _ in GAME_FACTS)
+    add_game_facts(steam_kb, dataframe[to_atoms(dataframe['name']).isin(atoms)])
+
+    return removed, steam_kb.fact_count() - before + removed
+
 # Funzione che si occupa di popolare la knowledge base con i dati presi dal dataframe passato in input.
-# Crea una lista in cui inizialmente inserisce i dati estratti dal dataframe sottoforma di 'fatti' e 'regole'.
-# Questa lista viene poi inserita nella knowledge base creata con pytholog.
+# I fatti vengono caricati in blocco, colonna per colonna, direttamente negli indici della knowledge base
+# (un FactStore con indici hash per ogni argomento dei predicati, che accetta le stesse query in stile Prolog di pytholog),
+# senza generare e riparsare una stringa per ogni fatto. Le regole sono invece scritte in stile Prolog.
+# Il tempo di costruzione viene salvato in steam_kb.build_time.
 def populate_kb(dataframe):
-    
-    # creo la knowledge base e una lista in cui inserire i dati della kb
-    steam_kb = pl.KnowledgeBase('Steam Games')
+
+    start = time.perf_counter()
+
+    # creo la knowledge base e una lista in cui inserire le regole della kb
+    steam_kb = FactStore('Steam Games')
     kb = []
 
     # - FATTI
 
-    # fatti riguardanti gli sviluppattori dei giochi
-    # developer('name', 'developer')
-    data = dataframe[['name', 'developer']].drop_duplicates().to_dict(orient="records")
-    for d in data:
-        kb.append(f"developer({d['name'].lower()},{d['developer'].lower()})")
-
-    # fatti riguardanti chi ha pubblicato i giochi
-    # publisher('name', 'publisher')
-    data = dataframe[['name', 'publisher']].drop_duplicates().to_dict(orient="records")
-    for d in data:
-        kb.append(f"publisher({d['name'].lower()},{d['publisher'].lower()})")
-
-    # fatti riguardanti i prezzi dei giochi
-    # prices('name', 'price')
-    data = dataframe[['name', 'price']].drop_duplicates().to_dict(orient="records")
-    for d in data:
-        kb.append(f"prices({d['name'].lower()},{d['price']})")
-
-    # fatti riguardanti i ratings in stelle dei giochi
-    # stars('name', 'star')
-    data = dataframe[['name', 'star']].drop_duplicates().to_dict(orient="records")
-    for d in data:
-        kb.append(f"stars({d['name'].lower()},{d['star']})")
-
-    # fatti riguardanti i generi dei giochi
-    # genre('name', 'steamspy_tags')
-    data = dataframe[['name', 'steamspy_tags']].drop_duplicates().to_dict(orient="records")
-    for d in data:
-        kb.append(f"genre({d['name'].lower()},{d['steamspy_tags'].lower()})")
-
-    # fatti che ci dicono se un gioco è in inglese o meno
-    # has_english('name', 'english')
-    data = dataframe[['name', 'english']].drop_duplicates().to_dict(orient="records")
-    for d in data:
-        kb.append(f"english({d['name'].lower()},{d['english'].lower()})")
+    add_game_facts(steam_kb, dataframe)
 
     # - REGOLE
 
@@ -114,94 +117,203 @@ def populate_kb(dataframe):
 
     steam_kb(kb)
 
+    steam_kb.build_time = time.perf_counter() - start
+
     return steam_kb
 
-def liking_prob(dataframe):
+# - RICERCHE SU VALORI NUMERICI
 
-    liking_kb = pl.KnowledgeBase('Liking Probability')
-    kb = []
+# Le funzioni seguenti usano gli indici ordinati della knowledge base e restituiscono generatori:
+# i risultati vengono prodotti solo quando servono, senza costruire l'intera lista delle risposte.
 
-    # chiedo di darmi il nome di un gioco che è piaciuto all'utente e di un gioco di cui vuole sapere la liking probability
-    Gioco_Piaciuto = input("Insrisci il nome del gioco che ti è piaciuto: ").lower()
-    genere = input("Dimmi il genere del gioco: ").lower()
-    tempo_gioco = input("e il tempo di gioco medio: ")
-    tempo_gioco = int(tempo_gioco)
-    # aggiungo i fatti riguardanti questo gioco
-    kb.append(f"is_genre({Gioco_Piaciuto}, {genere}")
-    kb.append(f"avg_playtime({Gioco_Piaciuto}, %s" % tempo_gioco)
-    kb.append(f"liked_game(utente, {Gioco_Piaciuto}")
+# Funzione che restituisce i giochi con prezzo compreso tra low e high (estremi inclusi), dal più economico
+def games_in_price_range(kb, low, high):
 
-    Gioco_Nuovo = input("\nInserisci il nome di un gioco di cui vuoi calcolare la probabilità che ti piaccia: ").lower()
-    genere_n = input("Dimmi il genere del gioco: ").lower()
-    tempo_gioco_n = input("e il tempo di gioco medio: ")
-    tempo_gioco_n = int(tempo_gioco_n)
-    # aggiungo i fatti riguardanti questo gioco
-    kb.append(f"is_genre({Gioco_Nuovo}, {genere_n}")
-    kb.append(f"avg_playtime({Gioco_Nuovo}, %s" % tempo_gioco_n)
+    return (name for name, price in kb.range_facts('prices', low, high))
 
-    # chiedo di sapere quante ora l'utente lavora in un giorno
-    Orario = input("\nQuante ore lavori/studi al giorno? ")
-    Orario = int(Orario)
-    # fatto che associa l'utente e le sue ore di lavorio giornaliere
-    kb.append(f"has_work(utente, %s)" % Orario)
-    # regola che calcola lo stress dell'utente
-    kb.append(f"stress(utente, Prob) :- Prob is %s" % Orario)
+# Funzione che restituisce i giochi con almeno min_stars stelle, dal voto più alto
+def games_with_min_stars(kb, min_stars):
+
+    return (name for name, star in kb.range_facts('stars', low=min_stars, descending=True))
+
+# Funzione che restituisce i giochi con tempo di gioco medio compreso tra low e high (None = nessun limite), dal più alto
+def games_by_playtime(kb, low=None, high=None):
+
+    return (name for name, playtime in kb.range_facts('avg_playtime', low, high, descending=True))
+
+# Funzione che restituisce gli n giochi più economici che hanno tra i generi (separati da ';') il genere indicato.
+# Scorre i prezzi in ordine crescente e controlla il genere di ogni gioco con l'indice sul nome dei fatti 'genre'.
+def cheapest_games_of_genre(kb, genre, n):
+
+    genre = genre.lower().replace(' ', '')
+    genre_index = kb.indexes.get('genre', [{}])[0]
+    genre_facts = kb.facts.get('genre', [])
+
+    def has_genre(name):
+        return any(genre in genre_facts[p][1].split(';') for p in genre_index.get(name, []))
+
+    return islice(((name, price) for name, price in kb.range_facts('prices') if has_genre(name)), n)
+
+# Funzione che restituisce i giochi i cui tag di genere hanno una similarità di Jaccard di almeno min_similarity
+# con i generi indicati (separati da ';'), dal più simile. Usa i bitset dei tag del catalogo preparati dallo scorer.
+def games_with_similar_genre(scorer, genres, min_similarity=0.5):
+
+    jaccard = scorer.vocabulary.jaccard_all(genres)
+    rows = np.flatnonzero(jaccard >= min_similarity)
+    rows = rows[np.argsort(-jaccard[rows], kind='stable')]
+    names = scorer.dataframe['name'].to_numpy()
+
+    return ((names[r], round(float(jaccard[r]), 2)) for r in rows)
+
+# Funzione che stampa i risultati di un generatore a pagine di page_size elementi, chiedendo all'utente se vuole vedere la pagina successiva
+def print_pages(results, page_size=100):
+
+    i = 1
+    while(True):
+        page = list(islice(results, page_size))
+        for r in page:
+            print(i, ")", r)
+            i += 1
+        if len(page) < page_size:
+            break
+        risposta = input("\nVuoi vedere altri risultati? (si/no) ")
+        if risposta not in ('si', 'sì', 's'):
+            break
+
+    if i == 1:
+        print("Nessun gioco trovato")
+
+# Funzione che restituisce il percorso dello snapshot della knowledge base relativo al catalogo
+def kb_path(filename=STEAM_CSV, cache_dir=CACHE_DIR):
+
+    return os.path.join(cache_dir, f"kb_v{KB_SNAPSHOT_VERSION}_{load_catalogue(filename, cache_dir)['source']['hash']}.pickle")
+
+# Funzione che restituisce la knowledge base del catalogo: se esiste uno snapshot relativo all'hash del csv lo ripristina,
+# altrimenti popola la knowledge base e ne salva lo snapshot. Se il csv cambia cambia anche l'hash, quindi la kb viene ricostruita.
+# Il tempo impiegato viene salvato in steam_kb.build_time.
+def load_kb(dataframe, filename=STEAM_CSV, cache_dir=CACHE_DIR):
+
+    start = time.perf_counter()
+
+    path = kb_path(filename, cache_dir)
+
+    if os.path.exists(path):
+        steam_kb = FactStore.load(path)
+        steam_kb.build_time = time.perf_counter() - start
+        steam_kb.restored = True
+    else:
+        steam_kb = populate_kb(dataframe)
+        os.makedirs(cache_dir, exist_ok=True)
+        steam_kb.save(path)
+        steam_kb.restored = False
+
+    return steam_kb
 
-    # aggiungo i fatti che associano un genere al genere stesso, potendo dare la conferma che due generi siano uguali
-    data = dataframe['genres']
-    result = list(set(data))
-    i = 0
-    while(i < len(result)):
-        kb.append(f"same_genre({result[i].lower()},{result[i].lower()}")
-        i += 1
+# - LIKING PROBABILITY
 
-    # l'utente può chiedere l'avg_playtime di un gioco
-    kb.append("has_avg_playtime(X, Y) :- avg_playtime(X, Y)")
+# limiti superiori (inclusi) della differenza di tempo di gioco medio e relativi punteggi di assign_range;
+# oltre l'ultimo limite il punteggio è 0
+PLAYTIME_BINS = [100, 250, 500, 750, 1000, 1250, 1500, 1750, 2000, 2500, 10000]
+PLAYTIME_SCORES = [100, 90, 80, 70, 60, 50, 40, 30, 20, 20, 10, 0]
 
-    # regola che fa la differenza tra l’avg_playtime del gioco che già piace all’utente e del gioco nuovo.
-    # kb.append(f"avg_playtime_comp({Gioco_Piaciuto}, {Gioco_Nuovo}, Y) :- liked_game(utente, Gioco_Piaciuto), has_avg_playtime({Gioco_Piaciuto}, Avg1), has_avg_playtime({Gioco_Nuovo}, Avg2), Y is Avg1 - Avg2")
-    kb.append(f"avg_playtime_comp(Gioco1, Gioco2, Y) :- liked_game(utente, Gioco1), has_avg_playtime(Gioco1, Avg1), has_avg_playtime(Gioco2, Avg2), Y is Avg1 - Avg2")
+# Calcolatore riutilizzabile della probabilità che un nuovo gioco piaccia all'utente.
+# La parte statica (il vocabolario dei tag di genere del catalogo, che sostituisce i fatti same_genre(G, G), e le regole
+# avg_playtime_comp, has_same_genre, compatibility e to_like) viene preparata una sola volta; ogni punteggio è poi un calcolo diretto:
+#   Prob = ore_lavoro + assign_range(avg_playtime_piaciuto - avg_playtime_nuovo) + similarità_genere
+# limitato tra 0 e 100, come la regola to_like(utente, Num1, Num2, Prob) :- stress(utente, P1), compatibility(Num1, Num2, S1), Prob is P1 + S1.
+# La similarità di genere va da -2.5 a 2.5: con genre_mode='jaccard' è proporzionale alla sovrapposizione dei tag (Jaccard),
+# con genre_mode='exact' vale 2.5 solo se i due giochi hanno gli stessi tag e -2.5 altrimenti.
+class LikingScorer:
 
-    # Regola che controlla se due giochi hanno lo stesso genere
-    kb.append(f"has_same_genre(Gioco1, Gioco2) :- is_genre(Gioco1, X), is_genre(Gioco2, Y), same_genre(X, Y)")
+    def __init__(self, dataframe, genre_mode='jaccard'):
 
-    liking_kb(kb)
+        self.dataframe = dataframe
+        self.genre_mode = genre_mode
+        self.vocabulary = GenreVocabulary(dataframe['genres'])
 
-    # PLAYTIME SIMILARITY
+    # avg_playtime_comp: punteggio (vettorizzato) della differenza tra i tempi di gioco medi
+    @staticmethod
+    def playtime_similarity(liked_playtime, new_playtime):
 
-    # faccio la query per potermi salvare il valore di Y
-    result = liking_kb.query(pl.Expr(f"avg_playtime_comp({Gioco_Piaciuto}, {Gioco_Nuovo}, What)"))
-    Playtime_Similarity = result[0]['What']
+        difference = np.abs(np.trunc(np.asarray(liked_playtime, dtype=np.float64) - np.asarray(new_playtime, dtype=np.float64)))
 
-    Playtime_Similarity = assign_range(Playtime_Similarity)
+        return np.asarray(PLAYTIME_SCORES)[np.digitize(difference, PLAYTIME_BINS, right=True)]
 
-    # GENRE SIMILARITY
+    # has_same_genre: similarità di genere tra il gioco piaciuto e uno o più giochi nuovi.
+    # Se rows (posizioni nel catalogo dei giochi nuovi) è indicato, i tag vengono presi dai bitset del catalogo.
+    def genre_similarity(self, liked_genre, new_genre, rows=None):
 
-    result = liking_kb.query(pl.Expr(f"has_same_genre({Gioco_Piaciuto}, {Gioco_Nuovo})"))
-    bool = result[0]
-    Genre_Similarity = 0
-    if(bool == 'Yes'):
-        Genre_Similarity = 2.5
-    elif(bool == 'No'):
-        Genre_Similarity = -2.5
+        if self.genre_mode == 'exact':
+            same = np.asarray([self.vocabulary.same_genre(liked_genre, g) for g in np.atleast_1d(new_genre)])
+            return np.where(same, 2.5, -2.5)
 
-    # regola che calcola la compatibilità dei 2 giochi
-    kb.append(f"compatibility(Num1, Num2, S1) :- S1 is Num1 + Num2")
+        if rows is not None:
+            jaccard = self.vocabulary.jaccard_all(liked_genre, rows)
+        else:
+            jaccard = np.asarray([self.vocabulary.jaccard(liked_genre, g) for g in np.atleast_1d(new_genre)])
 
-    # aggiungo la regola che calcola la probabilità che il gioco nuovo possa piacere all'utente
-    # Regola che calcola la probabilità che il nuovo gioco possa piacere all'utente
-    kb.append(f"to_like(utente, Num1, Num2, Prob) :- stress(utente, P1), compatibility(Num1, Num2, S1), Prob is P1 + S1")
+        return 5 * jaccard - 2.5
 
-    liking_kb(kb)
+    # to_like: probabilità per un gioco nuovo (o per un array di giochi nuovi), limitata tra 0 e 100
+    def score(self, liked_playtime, liked_genre, new_playtime, new_genre, work_hours, rows=None):
 
-    result = liking_kb.query(pl.Expr(f"to_like(utente, {Playtime_Similarity}, {Genre_Similarity}, What)"))
-    comp = list(result[0].keys())[0]
-    p = result[0][f"{comp}"]
+        compatibility = self.playtime_similarity(liked_playtime, new_playtime) + self.genre_similarity(liked_genre, new_genre, rows)
+        prob = np.clip(work_hours + compatibility, 0, 100)
 
-    if(p > 100):
-        p = 100
-    elif(p < 0):
-        p = 0
+        return prob if np.ndim(new_playtime) else float(prob[0])
+
+    # Funzione batch: calcola la probabilità per tutti i giochi candidati (nomi del catalogo, tutti se None)
+    # rispetto al gioco piaciuto all'utente, prendendo tempo di gioco medio e genere dal catalogo.
+    # Restituisce una Series nome -> probabilità, ordinata dalla più alta.
+    # Se il gioco piaciuto o uno dei candidati non è nel catalogo viene sollevato KeyError.
+    # Con exclude_liked=True il gioco piaciuto non viene valutato insieme a tutti gli altri (quando candidates è None).
+    def score_games(self, liked_game, work_hours, candidates=None, name_index=None, exclude_liked=False):
+
+        name_index = name_index or get_name_index()
+
+        def position(name):
+            p = name_index.lookup(name)
+            if p is None:
+                raise KeyError('Gioco non trovato: ' + str(name))
+            return p
+
+        liked_position = position(liked_game)
+        liked = self.dataframe.iloc[liked_position]
+
+        if candidates is None:
+            rows = np.arange(len(self.dataframe))
+            if exclude_liked:
+                rows = np.delete(rows, liked_position)
+        else:
+            rows = np.array([position(c) for c in candidates], dtype=np.int64)
+        data = self.dataframe.iloc[rows]
+
+        prob = self.score(liked['average_playtime'], liked['genres'], data['average_playtime'].to_numpy(), data['genres'].to_numpy(), work_hours, rows)
+
+        return pd.Series(prob, index=data['name'].to_numpy()).sort_values(ascending=False, kind='stable')
+
+# Funzione interattiva che chiede all'utente un gioco che gli è piaciuto, un gioco nuovo e le sue ore di lavoro,
+# e stampa la probabilità che il gioco nuovo gli piaccia. Lo scorer può essere passato per non ricostruirlo ad ogni chiamata.
+def liking_prob(dataframe, scorer=None):
+
+    scorer = scorer or LikingScorer(dataframe)
+
+    # chiedo di darmi il nome di un gioco che è piaciuto all'utente e di un gioco di cui vuole sapere la liking probability
+    Gioco_Piaciuto = input("Insrisci il nome del gioco che ti è piaciuto: ").lower()
+    genere = input("Dimmi il genere del gioco: ").lower()
+    tempo_gioco = input("e il tempo di gioco medio: ")
+    tempo_gioco = int(tempo_gioco)
+
+    Gioco_Nuovo = input("\nInserisci il nome di un gioco di cui vuoi calcolare la probabilità che ti piaccia: ").lower()
+    genere_n = input("Dimmi il genere del gioco: ").lower()
+    tempo_gioco_n = input("e il tempo di gioco medio: ")
+    tempo_gioco_n = int(tempo_gioco_n)
+
+    # chiedo di sapere quante ora l'utente lavora in un giorno
+    Orario = input("\nQuante ore lavori/studi al giorno? ")
+    Orario = int(Orario)
+
+    p = scorer.score(tempo_gioco, genere, tempo_gioco_n, genere_n, Orario)
 
     print("\nLa probabilità che", Gioco_Nuovo, "ti possa piacere è:", p, "%")
 
@@ -236,13 +348,34 @@ def assign_range(num):
 
     return i
 
+# Funzione che, tramite l'indice dei nomi, restituisce il nome del gioco come compare nella knowledge base (in minuscolo),
+# oppure None se il gioco non è presente nel dataset
+def kb_game_name(name_index, name):
+
+    resolved = name_index.resolve(name)
+
+    return None if resolved is None else resolved.lower()
+
+# Funzione che restituisce il valore della variabile nella prima risposta della query, oppure None se la query non ha risposte ('No')
+def first_answer(kb, query, variable='What'):
+
+    result = kb.query(query)
+
+    return result[0][variable] if isinstance(result[0], dict) else None
+
+# domande sulle caratteristiche di un gioco del menu: scelta -> predicato
+GAME_QUESTIONS = {1: 'developed_by', 2: 'released_by', 3: 'has_price', 4: 'quality', 5: 'is_genre', 6: 'has_english'}
+
 # - MAIN - INTERAZIONE CON L'UTENTE
 def main_kb():
 
     dataframe = build_dataframe()
-    kb = populate_kb(dataframe)
+    kb = load_kb(dataframe)
+    name_index = get_name_index()
+    scorer = LikingScorer(dataframe)
 
     print("\nKNOWLEDGE BASE\n")
+    print("(Knowledge base %s in %.2f secondi, %d fatti)\n" % ("ripristinata" if kb.restored else "costruita", kb.build_time, kb.fact_count()))
     print("Benvenuto, qui puoi eseguire ricerche sui giochi e sulle loro caratteristiche")
 
     while(True):
@@ -257,7 +390,13 @@ def main_kb():
 
         if(c1 == 1):
             while(True):
-                game_name = input("Dammi il nome di un gioco: ").lower()
+                nome = input("Dammi il nome di un gioco (premi invio o scrivi 'q' per tornare indietro): ")
+                if nome.strip() in ('', 'q'):
+                    break
+                game_name = kb_game_name(name_index, nome)
+                if game_name is None:
+                    print("\nIl gioco non è presente nel dataset\n")
+                    continue
                 print("Queste sono le caratteristiche che puoi cercare:")
                 print("1) Chi lo ha sviluppato")
                 print("2) Chi lo ha distribuito")
@@ -268,34 +407,30 @@ def main_kb():
                 choice2 = input("Selezionane una: ")
                 c2 = int(choice2)
 
-                if(c2 == 1):
-                    result = kb.query(pl.Expr(f"developed_by(What,{game_name})"))
-                    parola = result[0]['What']
+                # il nome viene messo tra apici perché può contenere virgole
+                parola = None
+                if c2 in GAME_QUESTIONS:
+                    parola = first_answer(kb, f"{GAME_QUESTIONS[c2]}(What,{quote_term(game_name)})")
+
+                if(parola is None):
+                    print("\nNessuna informazione trovata per", game_name)
+
+                elif(c2 == 1):
                     print("\n", game_name, "è stato sviluppato da:", parola)
 
                 elif(c2 == 2):
-                    result = kb.query(pl.Expr(f"released_by(What,{game_name})"))
-                    parola = result[0]['What']
                     print("\n", game_name, "è stato rilasciato da:", parola)
 
                 elif(c2 == 3):
-                    result = kb.query(pl.Expr(f"has_price(What,{game_name})"))
-                    parola = result[0]['What']
                     print("\n", game_name, "costa:", parola)
 
                 elif(c2 == 4):
-                    result = kb.query(pl.Expr(f"quality(What,{game_name})"))
-                    parola = result[0]['What']
                     print("\n", game_name, "ha:", parola, "stelle")
 
                 elif(c2 == 5):
-                    result = kb.query(pl.Expr(f"is_genre(What,{game_name})"))
-                    parola = result[0]['What']
                     print("\nIl genere di", game_name, "è:", parola)
 
                 elif(c2 == 6):
-                    result = kb.query(pl.Expr(f"has_english(What,{game_name})"))
-                    parola = result[0]['What']
                     if (parola == 'yes'):
                         print("\n", game_name, "è disponibile in lingua inglese")
                     elif (parola == 'no'):
@@ -314,26 +449,58 @@ def main_kb():
             while(True):
                 print("1) Lista di giochi di un prezzo")
                 print("2) Confronto di qualità tra 2 giochi")
-                print("3) Indietro\n")
+                print("3) Indietro")
+                print("4) Lista di giochi in una fascia di prezzo")
+                print("5) Lista di giochi con almeno un numero di stelle")
+                print("6) I giochi più economici di un genere")
+                print("7) Lista di giochi con generi simili\n")
                 choice3 = input("Selezionane una (inserisci il numero corrispondente alla tua scelta): ")
                 c3 = int(choice3)
 
                 if(c3 == 1):
-                    prezzo = input("Inserisci un prezzo: ")
-                    result = kb.query(pl.Expr(f"has_price({prezzo},What)"))
-                    print("\nEcco la lista dei primi 100 giochi con prezzo ", prezzo, ":\n")
-                    result = result[0:100]
-                    i = 1
-                    for r in result:
-                        print(i, ")", r[f"{prezzo}"])
-                        i += 1
+                    prezzo = float(input("Inserisci un prezzo: "))
+                    print("\nEcco la lista dei giochi con prezzo ", prezzo, ":\n")
+                    print_pages(games_in_price_range(kb, prezzo, prezzo))
+                    print("\nPuoi selezionare una nuova ricerca:")
+
+                elif(c3 == 4):
+                    minimo = float(input("Inserisci il prezzo minimo: "))
+                    massimo = float(input("Inserisci il prezzo massimo: "))
+                    print("\nEcco la lista dei giochi con prezzo tra", minimo, "e", massimo, ":\n")
+                    print_pages(games_in_price_range(kb, minimo, massimo))
+                    print("\nPuoi selezionare una nuova ricerca:")
+
+                elif(c3 == 5):
+                    stelle = int(input("Inserisci il numero minimo di stelle (da 1 a 5): "))
+                    print("\nEcco la lista dei giochi con almeno", stelle, "stelle:\n")
+                    print_pages(games_with_min_stars(kb, stelle))
+                    print("\nPuoi selezionare una nuova ricerca:")
+
+                elif(c3 == 6):
+                    genere = input("Inserisci il genere: ")
+                    n = int(input("Quanti giochi vuoi vedere? "))
+                    print("\nEcco i", n, "giochi più economici del genere", genere, ":\n")
+                    print_pages(cheapest_games_of_genre(kb, genere, n))
+                    print("\nPuoi selezionare una nuova ricerca:")
+
+                elif(c3 == 7):
+                    generi = input("Inserisci i generi:\t (ricorda tra una parola e l'altra di mettere il simbolo ';' )\n")
+                    soglia = float(input("Inserisci la similarità minima (da 0 a 1): "))
+                    print("\nEcco la lista dei giochi con generi simili a", generi, "(similarità):\n")
+                    print_pages(games_with_similar_genre(scorer, generi, soglia))
                     print("\nPuoi selezionare una nuova ricerca:")
 
                 # confronto di qualità tra 2 giochi
                 elif(c3 == 2):
-                    game1 = input("Dimmi il nome del primo gioco: ").lower()
-                    game2 = input("Dimmi il nome del secondo gioco: ").lower()
-                    result = kb.query(pl.Expr(f"quality_check({game1}, {game2}, X, Y"))
+                    game1 = kb_game_name(name_index, input("Dimmi il nome del primo gioco: "))
+                    game2 = kb_game_name(name_index, input("Dimmi il nome del secondo gioco: "))
+                    if game1 is None or game2 is None:
+                        print("\nUno dei due giochi non è presente nel dataset\n")
+                        continue
+                    result = kb.query(f"quality_check({quote_term(game1)}, {quote_term(game2)}, X, Y)")
+                    if not isinstance(result[0], dict):
+                        print("\nNessuna informazione trovata sulla qualità dei due giochi\n")
+                        continue
                     star1 = result[0]['X']
                     star2 = result[0]['Y']
                     if(star1 > star2):
@@ -352,9 +519,15 @@ def main_kb():
                 print("Questi sono le caratteristiche che puoi verificare:")
                 print("1) developer\n2) publisher\n3) prices\n4) stars\n5) genre\n6) english\n")
                 fatto = input("Selezionane una (scrivi il nome dell'operazione da eseguire, tutto in minuscolo): ").lower()
-                name = input("Quale gioco vuoi controllare? ").lower()
+                nome = input("Quale gioco vuoi controllare? (premi invio o scrivi 'q' per tornare indietro) ")
+                if nome.strip() in ('', 'q'):
+                    break
+                name = kb_game_name(name_index, nome)
+                if name is None:
+                    print("\nIl gioco non è presente nel dataset\n")
+                    continue
                 char = input("Inserisci un dato corrispondente alla caratteristica scelta: ").lower()
-                print(kb.query(pl.Expr(f"{fatto}({name},{char})")))
+                print(kb.query(f"{fatto}({quote_term(name)},{quote_term(char)})"))
                 risposta = input("Vuoi eseguire un'altra verifica o vuoi tornare indietro?\tIndietro (sì), Continua (no)")
                 if(risposta == 'sì'):
                     break
@@ -365,7 +538,7 @@ def main_kb():
 
         elif(c1 == 4):
             while(True):
-                liking_prob(dataframe)
+                liking_prob(dataframe, scorer)
                 risposta = input("Vuoi controllare un'altra probabilità o vuoi tornare indietro?\tIndietro (sì), Continua (no)")
                 if(risposta == 'sì'):
                     break
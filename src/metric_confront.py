@@ -1,121 +1,183 @@
-from recommender_system import vectorize_data
+from recommender_system import load_steam_data, vectorize_data
+import argparse
+import csv
+import json
+import time
+import tracemalloc
+
 import numpy as np
 import pandas as pd
-import sklearn
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
-from sklearn.metrics.pairwise import euclidean_distances
-from scipy.stats import pearsonr
-import time
 
-#funzione che esegue una raccomandazione di giochi, utilizzando come metrica per il calcolo di similarità il coseno e si ricava la quantità di tempo utilizzata
-#per l'elaborazione
-def recommend_cosine(data):
-
-    nome = "Team Fortress Classic"
-    index = data.index[data['name'] == nome].values[0]
-    
-    data['all_content'] = data['name'] + ';' + data['developer'] + ';' + data['publisher'] + ';' + data['platforms'] + ';' + data['genres'] #definisci le categorie che vuoi usare e uniscile in una, per poter applicare il tf-idf
-    
-    start = time.time()
-
-    tfidf_matrix = vectorize_data(data)
-    cosine_similarity = linear_kernel(tfidf_matrix, tfidf_matrix) #costruzione della similarità del coseno da applicare poi alla matrice creata
-
-    indices = pd.Series(data['name'].index)
-
-    id = indices[index]
-    # Get the pairwise similarity scores of all books compared that book,
-    # sorting them and getting top 5
-    similarity_scores = list(enumerate(cosine_similarity[id]))
-    similarity_scores = sorted(similarity_scores, key=lambda x: x[1], reverse=True)
-    similarity_scores = similarity_scores[1:6]
-    
-    #Get the books index
-    games_index = [i[0] for i in similarity_scores]
-    
-    #Return the top 5 most similar games using integer-location based indexing (iloc)
-    result = data[['name','genres','developer','price']].iloc[games_index]
-
-    end = time.time()
-    print("Tempo di esecuzione con similarità del coseno: ", end - start)
-
-#funzione che esegue una raccomandazione di giochi, utilizzando come metrica per il calcolo di similarità la distanza Euclidea e si ricava la quantità di tempo utilizzata
-#per l'elaborazione
-def recommend_euclidean(data):
-
-    nome = "Team Fortress Classic"
-    index = data.index[data['name'] == nome].values[0]
-    
-    data['all_content'] = data['name'] + ';' + data['developer'] + ';' + data['publisher'] + ';' + data['platforms'] + ';' + data['genres'] #definisci le categorie che vuoi usare e uniscile in una, per poter applicare il tf-idf
-    
-    start = time.time()
-
-    tfidf_matrix = vectorize_data(data)
-    euclidean = euclidean_distances(tfidf_matrix) #costruzione della similarità del coseno da applicare poi alla matrice creata
-
-    indices = pd.Series(data['name'].index)
-
-    id = indices[index]
-    # Get the pairwise similarity scores of all books compared that book,
-    # sorting them and getting top 5
-    similarity_scores = list(enumerate(euclidean[id]))
-    similarity_scores = sorted(similarity_scores, key=lambda x: x[1], reverse=True)
-    similarity_scores = similarity_scores[1:6]
-    
-    #Get the books index
-    games_index = [i[0] for i in similarity_scores]
-    
-    #Return the top 5 most similar games using integer-location based indexing (iloc)
-    result = data[['name','genres','developer','price']].iloc[games_index]
-
-    end = time.time()
-    print("\nTempo di esecuzione con distanza euclidea: ", end - start)
-
-#funzione che esegue una raccomandazione di giochi, utilizzando come metrica per il calcolo di similarità Pearson e si ricava la quantità di tempo utilizzata
-#per l'elaborazione
-def recommend_pearson(data):
-
-    index = 0
-    
-    data['all_content'] = data['name'] + ';' + data['developer'] + ';' + data['publisher'] + ';' + data['platforms'] + ';' + data['genres'] #definisci le categorie che vuoi usare e uniscile in una, per poter applicare il tf-idf
-    
-    start = time.time()
-
-    tfidf_matrix = vectorize_data(data)
-    tfidf_matrix_array = tfidf_matrix.toarray()
-
-    indices = pd.Series(data['name'].index)
-
-    id = indices[index]
-    correlation = []
-    for i in range(len(tfidf_matrix_array)):
-        correlation.append(pearsonr(tfidf_matrix_array[id], tfidf_matrix_array[i])[0])
-    correlation = list(enumerate(correlation))
-    sorted_corr = sorted(correlation, reverse=True, key=lambda x: x[1])[1:6]
-    games_index = [i[0] for i in sorted_corr]
-
-    result = data[['name','genres','developer','price']].iloc[games_index]
-
-    end = time.time()
-    print("\nTempo di esecuzione con correlazione di Pearson: ", end - start)
+from name_index import NameIndex
+from similarity import cosine_scores, euclidean_scores, pearson_scores, row_statistics, top_k
+from tfidf_model import build_content
+
+# - CONFRONTO DELLE METRICHE (BENCHMARK)
+
+#colonne restituite dalle raccomandazioni
+RESULT_COLUMNS = ['name', 'genres', 'developer', 'price']
+
+#colonne dei record del benchmark (intestazione del csv dei risultati, anche quando non ci sono record)
+RECORD_FIELDS = ['metric', 'catalogue_size', 'queries', 'vectorize_ms', 'runs', 'mean_ms', 'median_ms', 'p95_ms', 'min_ms', 'max_ms', 'peak_memory_mb']
+
+#funzione che prepara i dati condivisi da tutte le metriche per un catalogo: la matrice tfidf (costruita su una copia
+#delle colonne, senza aggiungere 'all_content' al dataframe ricevuto), l'indice dei nomi e le statistiche per riga (Pearson e distanza euclidea)
+def prepare_data(data):
+
+    content = pd.DataFrame({'all_content': build_content(data)})
+    tfidf_matrix = vectorize_data(content).tocsr()
+
+    return {'data': data, 'tfidf': tfidf_matrix, 'names': NameIndex(data['name']), 'stats': row_statistics(tfidf_matrix)}
+
+#funzione che esegue una raccomandazione di giochi, utilizzando come metrica per il calcolo di similarità il coseno
+def recommend_cosine(prepared, nome, k=5):
+
+    position = prepared['names'].lookup(nome)
+
+    scores = cosine_scores(prepared['tfidf'], prepared['tfidf'][position])[0]
+    games_index = top_k(scores, k=k)
+
+    return prepared['data'][RESULT_COLUMNS].iloc[games_index]
+
+#funzione che esegue una raccomandazione di giochi, utilizzando come metrica per il calcolo di similarità la distanza Euclidea.
+#Le distanze vengono calcolate solo tra la riga del gioco e il catalogo (con le norme delle righe già calcolate) e i giochi
+#vengono ordinati dal più vicino al più lontano. nome può essere anche una lista di giochi: in quel caso le distanze vengono
+#calcolate con un'unica moltiplicazione e viene restituita una lista di risultati
+def recommend_euclidean(prepared, nome, k=5):
+
+    batch = not isinstance(nome, str)
+    names = list(nome) if batch else [nome]
+    positions = [prepared['names'].lookup(n) for n in names]
+
+    distances = euclidean_scores(prepared['tfidf'], prepared['tfidf'][positions], prepared['stats'][1])
+    results = [prepared['data'][RESULT_COLUMNS].iloc[games_index] for games_index in top_k(-distances, k=k)]
+
+    return results if batch else results[0]
+
+#funzione che esegue una raccomandazione di giochi, utilizzando come metrica per il calcolo di similarità la correlazione di Pearson
+def recommend_pearson(prepared, nome, k=5):
+
+    position = prepared['names'].lookup(nome)
+
+    scores = pearson_scores(prepared['tfidf'], prepared['tfidf'][position], prepared['stats'])[0]
+    games_index = top_k(scores, k=k)
+
+    return prepared['data'][RESULT_COLUMNS].iloc[games_index]
+
+METRICS = {'cosine': recommend_cosine, 'euclidean': recommend_euclidean, 'pearson': recommend_pearson}
 
 #funzione che calcola la percentuale di spasità che un dataset possa avere
 def calculating_sparsity(data):
-    
+
     data = data.to_numpy()
 
     sparsity = 1.0 - (np.count_nonzero(data) / float(data.size))
 
-    print('\nSparsità del dataset:', sparsity*100, "%\n")
-
-
-steam_data = pd.read_csv('dataset/steam.csv')
-steam_data['positivity_quote'] = steam_data['positive_ratings'] // steam_data['negative_ratings']
-steam_data['genres'] = steam_data['steamspy_tags']
-steam_data = steam_data[['name','release_date','developer','publisher','platforms','genres','positivity_quote', 'average_playtime','owners','price']].copy()
-
-recommend_cosine(steam_data)
-recommend_euclidean(steam_data)
-recommend_pearson(steam_data)
-calculating_sparsity(steam_data)
+    return sparsity * 100
+
+#funzione che riassume una lista di tempi (in secondi) in statistiche in millisecondi
+def timing_stats(samples):
+
+    samples = np.asarray(samples) * 1000
+
+    return {'runs': len(samples), 'mean_ms': float(samples.mean()), 'median_ms': float(np.median(samples)),
+            'p95_ms': float(np.percentile(samples, 95)), 'min_ms': float(samples.min()), 'max_ms': float(samples.max())}
+
+#funzione che misura una metrica su un catalogo già preparato: per ogni gioco query esegue warmup esecuzioni non misurate e
+#repetitions esecuzioni misurate con perf_counter; il picco di memoria viene misurato con tracemalloc in un'esecuzione separata,
+#per non alterare i tempi
+def benchmark_metric(metric, prepared, games, warmup=1, repetitions=5):
+
+    recommend = METRICS[metric]
+
+    samples = []
+    for nome in games:
+        for _ in range(warmup):
+            recommend(prepared, nome)
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            recommend(prepared, nome)
+            samples.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    recommend(prepared, games[0])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return dict(timing_stats(samples), peak_memory_mb=peak / 2**20)
+
+#funzione che esegue il benchmark di tutte le metriche indicate per ogni dimensione del catalogo (le prime size righe; None = intero
+#catalogo). I giochi query assenti da un catalogo ridotto vengono saltati; se games è None si usano n_queries giochi scelti a caso
+#(con seed fisso) tra le righe comuni a tutte le dimensioni. Restituisce una lista di record, uno per (dimensione, metrica).
+def run_benchmark(filename='dataset/steam.csv', games=None, sizes=(None,), metrics=tuple(METRICS), warmup=1, repetitions=5, n_queries=3, seed=1):
+
+    steam_data = load_steam_data(filename)
+    sizes = [len(steam_data) if size is None else min(size, len(steam_data)) for size in sizes]
+
+    if games is None:
+        rng = np.random.default_rng(seed)
+        games = list(steam_data['name'].iloc[rng.choice(min(sizes), size=min(n_queries, min(sizes)), replace=False)])
+
+    records = []
+    for size in sizes:
+        data = steam_data.iloc[:size]
+
+        start = time.perf_counter()
+        prepared = prepare_data(data)
+        vectorize_time = time.perf_counter() - start
+
+        present = [nome for nome in games if nome in prepared['names']]
+        if not present:
+            continue
+        for metric in metrics:
+            record = {'metric': metric, 'catalogue_size': size, 'queries': len(present), 'vectorize_ms': vectorize_time * 1000}
+            record.update(benchmark_metric(metric, prepared, present, warmup, repetitions))
+            records.append(record)
+
+    return records
+
+#funzione che salva i risultati del benchmark in json o in csv, in base all'estensione del file
+def save_results(records, path):
+
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=RECORD_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=1)
+
+# Benchmark da riga di comando, ad esempio:
+# python metric_confront.py --games "Team Fortress Classic" --sizes 1000 5000 0 --repetitions 10 --output risultati.csv
+# (dimensione 0 = intero catalogo)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Confronto dei tempi di raccomandazione con coseno, distanza euclidea e Pearson')
+    parser.add_argument('--csv', default='dataset/steam.csv')
+    parser.add_argument('--games', nargs='+', help='giochi query (default: scelti a caso)')
+    parser.add_argument('--queries', type=int, default=3, help='numero di giochi query scelti a caso se --games non è indicato')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[0], help='dimensioni del catalogo (0 = intero catalogo)')
+    parser.add_argument('--metrics', nargs='+', choices=list(METRICS), default=list(METRICS))
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='file di output (.json o .csv)')
+    parser.add_argument('--sparsity', action='store_true', help='stampa anche la sparsità del dataset')
+    args = parser.parse_args()
+
+    if args.games:
+        names = NameIndex(load_steam_data(args.csv)['name'])
+        missing = [nome for nome in args.games if nome not in names]
+        if missing:
+            parser.error('giochi non presenti nel catalogo: ' + ', '.join(missing))
+
+    records = run_benchmark(args.csv, args.games, [size or None for size in args.sizes], args.metrics,
+                            args.warmup, args.repetitions, args.queries, args.seed)
+    if not records:
+        print('Nessun gioco query presente nei cataloghi indicati')
+    if args.output:
+        save_results(records, args.output)
+    print(json.dumps(records, indent=1))
+
+    if args.sparsity:
+        print('\nSparsità del dataset:', calculating_sparsity(load_steam_data(args.csv)), "%\n")
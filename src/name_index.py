@@ -0,0 +1,55 @@
+import re
+
+# - INDICE DEI NOMI
+
+# Funzione che normalizza il nome di un gioco: minuscolo (casefold), spazi iniziali/finali rimossi e spazi multipli ridotti a uno
+def normalize_name(name):
+
+    return re.sub(r'\s+', ' ', str(name)).strip().casefold()
+
+# Indice hash dei nomi dei giochi, costruito una sola volta sul catalogo caricato.
+# Per ogni nome esatto e per ogni nome normalizzato mantiene la lista delle posizioni (iloc) in cui compare,
+# così i nomi duplicati non vengono persi e la ricerca costa O(1) invece di una scansione del dataframe.
+class NameIndex:
+
+    def __init__(self, names):
+
+        self.names = list(names)
+        self.exact = {}
+        self.normalized = {}
+
+        for position, name in enumerate(self.names):
+            if not isinstance(name, str):
+                continue
+            self.exact.setdefault(name, []).append(position)
+            self.normalized.setdefault(normalize_name(name), []).append(position)
+
+    # restituisce tutte le posizioni del gioco: prima cerca il nome esatto, poi quello normalizzato
+    def positions(self, name):
+
+        if name in self.exact:
+            return self.exact[name]
+
+        return self.normalized.get(normalize_name(name), [])
+
+    # restituisce la prima posizione del gioco nel catalogo, oppure None se non è presente
+    def lookup(self, name):
+
+        positions = self.positions(name)
+
+        return positions[0] if positions else None
+
+    # restituisce il nome del gioco così come è scritto nel catalogo, oppure None se non è presente
+    def resolve(self, name):
+
+        position = self.lookup(name)
+
+        return None if position is None else self.names[position]
+
+    def __contains__(self, name):
+
+        return self.lookup(name) is not None
+
+    def __len__(self):
+
+        return len(self.normalized)
@@ -1,14 +1,19 @@
 from owlready2 import *
 
+from ontology_store import get_ontology_store
+
 def main_ontology():
     print("\nBENVENUTO NELLA STEAM-ONTOLOGY\n")
+
+    #l'ontologia viene aperta (dal quadstore salvato, se esiste) e indicizzata una sola volta
+    store = get_ontology_store('dataset/Steam-Ontology.owl')
+    ontology = store.ontology
+
     while(True):
-        print("Seleziona cosa vorresti esplorare:\n\n1) Visualizzazione Classi\n2) Visualizzazione proprietà d'oggetto\n3) Visualizzazione proprietà dei dati\n4) Visualizzazione query d'esempio\n5) Exit Ontologia\n")
+        print("Seleziona cosa vorresti esplorare:\n\n1) Visualizzazione Classi\n2) Visualizzazione proprietà d'oggetto\n3) Visualizzazione proprietà dei dati\n4) Visualizzazione query d'esempio\n5) Query congiuntiva\n6) Exit Ontologia\n")
 
         risposta_menù = input("Inserisci qui la tua scelta:\t")
 
-        ontology = get_ontology('dataset/Steam-Ontology.owl').load()
-
         if risposta_menù == '1':
             print("\nClassi presenti nell'ontologia:\n")
             print(list(ontology.classes()))
@@ -19,35 +24,35 @@ def main_ontology():
 
                 if risposta_class == '1':
                     print("\nLista di Agenti presenti:\n")
-                    agents = ontology.search(is_a = ontology.Agent)
+                    agents = store.instances_of('Agent')
                     print(agents)
                 elif risposta_class == '2':
                     print("\nLista dei Giochi presenti:\n")
-                    games = ontology.search(is_a = ontology.Game)
+                    games = store.instances_of('Game')
                     print(games)
                 elif risposta_class == '3':
                     print("\nLista degli Sviluppatori presenti:\n")
-                    developers = ontology.search(is_a = ontology.Developer)
+                    developers = store.instances_of('Developer')
                     print(developers)
                 elif risposta_class == '4':
                     print("\nLista delle Categorie presenti:\n")
-                    genres = ontology.search(is_a = ontology.Genre)
+                    genres = store.instances_of('Genre')
                     print(genres)
                 elif risposta_class == '5':
                     print("\nLista delle Piattaforme presenti:\n")
-                    platforms = ontology.search(is_a = ontology.Platform)
+                    platforms = store.instances_of('Platform')
                     print(platforms)
                 elif risposta_class == '6':
                     print("\nLista delle Case Pubblicatrici presenti:\n")
-                    publishers = ontology.search(is_a = ontology.Publisher)
+                    publishers = store.instances_of('Publisher')
                     print(publishers)
                 elif risposta_class == '7':
                     print("\nLista dei Clienti presenti:\n")
-                    costumers = ontology.search(is_a = ontology.Costumer)
+                    costumers = store.instances_of('Costumer')
                     print(costumers)
                 elif risposta_class == '8':
                     print("\nLista dei Negozi presenti:\n")
-                    shops = ontology.search(is_a = ontology.Shop)
+                    shops = store.instances_of('Shop')
                     print(shops)
                 else:
                     print("\nInserisci il numero correttamente tra quelli presentati")
@@ -66,13 +71,30 @@ def main_ontology():
         elif risposta_menù == '4':
             print("\nQuery d'esempio:")
             print("\n-Lista di Giochi che presentano la categoria 'Classic':\n")
-            games = ontology.search(is_a = ontology.Game, has_genre = ontology.search(is_a = ontology.Classic))
+            games = store.games_with(genre = 'Classic')
             print(games, "\n")
             print("\n-Lista di Giochi che presentano lo sviluppatore 'Valve':\n")
-            games = ontology.search(is_a = ontology.Game, has_developer = ontology.search(is_a = ontology.Valve))
+            games = store.games_with(developer = 'Valve')
             print(games, "\n")
             print("\n-Lista di Giochi che presentano la piattaforma 'Windows':\n")
-            games = ontology.search(is_a = ontology.Game, has_platform = ontology.search(is_a = ontology.Windows))
+            games = store.games_with(platform = 'Windows')
+            print(games, "\n")
+            print("\n-Lista di Giochi per 'Windows' sviluppati da 'Valve' con la categoria 'Classic':\n")
+            games = store.faceted_query('Game', has_platform = 'Windows', has_developer = 'Valve', has_genre = 'Classic')
             print(games, "\n")
         elif risposta_menù == '5':
+            print("\nScrivi la query come lista di atomi separati da virgole; le variabili iniziano con '?'.")
+            print("Esempio:\tGame(?g), has_developer(?g, Valve), has_platform(?g, Windows)\n")
+            testo = input("Inserisci qui la query:\t")
+            try:
+                risultati = store.query(testo)
+            except ValueError as errore:
+                print("\n", errore, "\n")
+                continue
+            if risultati == [{}]:
+                print("\nLa query è vera")
+            for riga in risultati:
+                print(riga)
+            print("\nRisultati:", len(risultati), "\tTempo di esecuzione:", round(store.last_latency * 1000, 2), "ms\n")
+        elif risposta_menù == '6':
             break
@@ -0,0 +1,219 @@
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+from owlready2 import label
+from owlready2.base import owl_named_individual, rdf_type, to_literal
+
+from catalogue import CACHE_DIR, STEAM_CSV, get_catalogue
+from ontology_store import ONTOLOGY_OWL, get_ontology_store, quadstore_path
+
+# colonne del catalogo che diventano relazioni: colonna -> (proprietà d'oggetto, classe dei valori)
+RELATIONS = {'developer': ('has_developer', 'Developer'), 'publisher': ('has_publisher', 'Publisher'),
+             'steamspy_tags': ('has_genre', 'Genre'), 'platforms': ('has_platform', 'Platform')}
+
+# colonne del catalogo che diventano proprietà dei dati del gioco: colonna -> proprietà
+DATA_PROPERTIES = {'price': 'price', 'english': 'english', 'achievements': 'achievement', 'average_playtime': 'average_playtime',
+                   'positive_ratings': 'positive_rating', 'negative_ratings': 'negative_rating', 'release_date': 'release_date',
+                   'required_age': 'required_age', 'star': 'rating'}
+
+# nomi delle piattaforme nel catalogo -> individui già presenti nell'ontologia
+PLATFORM_NAMES = {'windows': 'Windows', 'mac': 'Mac', 'linux': 'Linux'}
+
+# numero massimo di parametri per istruzione SQL (limite delle versioni meno recenti di SQLite)
+SQL_VARIABLES = 900
+
+# - IMPORTAZIONE DEL CATALOGO NELL'ONTOLOGIA
+
+# Funzione che trasforma un valore del catalogo nel nome di un individuo (es. 'Free to Play' -> 'Free_to_Play')
+def individual_name(value):
+
+    return re.sub(r'\W+', '_', value.strip()).strip('_')
+
+# Funzione che scompone un valore di una colonna relazione nei nomi degli individui corrispondenti
+def relation_values(column, value):
+
+    if not isinstance(value, str):
+        return []
+    names = [individual_name(v) for v in value.split(';')]
+    if column == 'platforms':
+        names = [PLATFORM_NAMES.get(n, n) for n in names]
+
+    return [n for n in names if n]
+
+# Funzione che calcola un hash per ogni riga del catalogo sulle colonne importate, per riconoscere le righe modificate.
+# Il valore viene convertito in int64 per poter essere salvato in SQLite.
+def row_hashes(steam_data):
+
+    columns = ['name'] + list(RELATIONS) + list(DATA_PROPERTIES)
+
+    return pd.util.hash_pandas_object(steam_data[columns].astype(str), index=False).to_numpy().view(np.int64)
+
+# Funzione che restituisce gli identificativi (storid) del quadstore per una lista di IRI: quelli esistenti vengono letti
+# con poche SELECT, per quelli nuovi viene riservato un intervallo di storid con un solo UPDATE e vengono inseriti in blocco
+def resolve_storids(db, iris):
+
+    storids = {}
+    iris = list(dict.fromkeys(iris))
+    for i in range(0, len(iris), SQL_VARIABLES):
+        chunk = iris[i:i + SQL_VARIABLES]
+        query = 'SELECT storid, iri FROM resources WHERE iri IN (%s)' % ','.join('?' * len(chunk))
+        storids.update((iri, storid) for storid, iri in db.execute(query, chunk))
+
+    missing = [iri for iri in iris if iri not in storids]
+    if missing:
+        db.execute('UPDATE store SET current_resource=current_resource+?', (len(missing),))
+        last = db.execute('SELECT current_resource FROM store').fetchone()[0]
+        new = list(zip(range(last - len(missing) + 1, last + 1), missing))
+        db.executemany('INSERT INTO resources VALUES (?,?)', new)
+        storids.update((iri, storid) for storid, iri in new)
+
+    return storids
+
+# Funzione che elimina tutte le triple (relazioni e dati) dei giochi indicati
+def delete_games(db, c, storids):
+
+    for i in range(0, len(storids), SQL_VARIABLES):
+        chunk = storids[i:i + SQL_VARIABLES]
+        placeholders = ','.join('?' * len(chunk))
+        db.execute(f'DELETE FROM objs WHERE c=? AND s IN ({placeholders})', [c] + chunk)
+        db.execute(f'DELETE FROM datas WHERE c=? AND s IN ({placeholders})', [c] + chunk)
+
+# Funzione che restituisce il numero di giochi del catalogo già importati nel quadstore dell'ontologia
+# (0 se il quadstore non esiste o se il catalogo non è mai stato importato), senza aprire l'ontologia
+def imported_rows(ontology_filename=ONTOLOGY_OWL, cache_dir=CACHE_DIR):
+
+    path = quadstore_path(ontology_filename, cache_dir)
+    if not os.path.exists(path):
+        return 0
+
+    db = sqlite3.connect(path)
+    try:
+        if db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='catalogue_rows'").fetchone() is None:
+            return 0
+        return db.execute('SELECT COUNT(*) FROM catalogue_rows').fetchone()[0]
+    finally:
+        db.close()
+
+# Funzione che importa i giochi del catalogo nell'ontologia: ogni gioco diventa un individuo 'game_<appid>' della classe Game
+# (con il nome come etichetta e le proprietà dei dati), e sviluppatori, case pubblicatrici, generi e piattaforme diventano
+# individui delle rispettive classi collegati con has_developer, has_publisher, has_genre e has_platform
+# (gli individui già presenti, come 'Valve' o 'Windows', vengono riutilizzati).
+# Le triple vengono scritte direttamente nelle tabelle SQLite del quadstore di owlready2, batch_size giochi per transazione.
+# Con incremental=True vengono importate solo le righe nuove o modificate rispetto all'importazione precedente (gli hash delle
+# righe sono salvati nel quadstore) e vengono eliminati i giochi non più presenti; con incremental=False tutti i giochi
+# vengono reimportati. Restituisce un report con il numero di righe e triple scritte e il throughput.
+def import_catalogue(filename=STEAM_CSV, ontology_filename=ONTOLOGY_OWL, batch_size=5000, incremental=True, cache_dir=CACHE_DIR):
+
+    start = time.perf_counter()
+    store = get_ontology_store(ontology_filename, cache_dir)
+    world, ontology = store.world, store.ontology
+    steam_data = get_catalogue(filename)
+
+    #chiude la transazione aperta da owlready2, così ogni batch è una transazione a sé
+    world.save()
+    db = world.graph.db
+    c = ontology.graph.c
+    base = ontology.base_iri
+
+    db.execute('CREATE TABLE IF NOT EXISTS catalogue_rows (appid INTEGER PRIMARY KEY, hash INTEGER)')
+    previous = dict(db.execute('SELECT appid, hash FROM catalogue_rows'))
+
+    appids = steam_data['appid'].to_numpy().astype(np.int64)
+    hashes = row_hashes(steam_data)
+    if incremental:
+        rows = [i for i, (appid, h) in enumerate(zip(appids.tolist(), hashes.tolist())) if previous.get(appid) != h]
+    else:
+        rows = list(range(len(steam_data)))
+    present = set(appids.tolist())
+    removed = [appid for appid in previous if appid not in present]
+
+    game_iri = lambda appid: f'{base}game_{appid}'
+    properties = {name: ontology[name].storid for name in [p for p, _ in RELATIONS.values()] + list(DATA_PROPERTIES.values())}
+    classes = {name: ontology[name].storid for name in ['Game'] + [cls for _, cls in RELATIONS.values()]}
+
+    #i giochi eliminati dal catalogo e quelli modificati vengono rimossi prima di essere reimportati
+    stale = [appid for appid in removed] + [int(appids[i]) for i in rows if int(appids[i]) in previous]
+    if stale:
+        stale_storids = list(resolve_storids(db, [game_iri(appid) for appid in stale]).values())
+        delete_games(db, c, stale_storids)
+        db.executemany('DELETE FROM catalogue_rows WHERE appid=?', [(appid,) for appid in removed])
+        db.commit()
+
+    n_objs = n_datas = n_batches = 0
+    known_values = set()
+    columns = {column: steam_data[column].to_numpy() for column in ['name'] + list(RELATIONS) + list(DATA_PROPERTIES)}
+
+    #le stesse stringhe (es. 'windows;mac;linux') si ripetono in molte righe: vengono scomposte una sola volta
+    parsed = {}
+    def names_of(column, value):
+        if (column, value) not in parsed:
+            parsed[column, value] = relation_values(column, value)
+        return parsed[column, value]
+
+    for first in range(0, len(rows), batch_size):
+        batch = rows[first:first + batch_size]
+
+        #IRI dei giochi del batch e dei valori delle relazioni
+        values = {(column, name) for column in RELATIONS for i in batch for name in names_of(column, columns[column][i])}
+        storids = resolve_storids(db, [game_iri(appids[i]) for i in batch] + [base + name for _, name in values])
+
+        objs = []
+        datas = []
+        for column, name in values:
+            value = storids[base + name]
+            if (value, column) not in known_values:
+                known_values.add((value, column))
+                objs.append((c, value, rdf_type, owl_named_individual))
+                objs.append((c, value, rdf_type, classes[RELATIONS[column][1]]))
+
+        for i in batch:
+            game = storids[game_iri(appids[i])]
+            objs.append((c, game, rdf_type, owl_named_individual))
+            objs.append((c, game, rdf_type, classes['Game']))
+            datas.append((c, game, label.storid) + to_literal(str(columns['name'][i])))
+            for column, (prop, _) in RELATIONS.items():
+                objs.extend((c, game, properties[prop], storids[base + name]) for name in names_of(column, columns[column][i]))
+            for column, prop in DATA_PROPERTIES.items():
+                value = columns[column][i]
+                if isinstance(value, str):
+                    datas.append((c, game, properties[prop]) + to_literal(value))
+                elif column == 'english':
+                    datas.append((c, game, properties[prop]) + to_literal(bool(value)))
+                elif not pd.isna(value):
+                    datas.append((c, game, properties[prop]) + to_literal(value.item()))
+
+        db.executemany('INSERT OR IGNORE INTO objs VALUES (?,?,?,?)', objs)
+        db.executemany('INSERT OR IGNORE INTO datas VALUES (?,?,?,?,?)', datas)
+        db.executemany('INSERT OR REPLACE INTO catalogue_rows VALUES (?,?)', [(int(appids[i]), int(hashes[i])) for i in batch])
+        db.commit()
+
+        n_objs += len(objs)
+        n_datas += len(datas)
+        n_batches += 1
+
+    if rows or removed:
+        world.graph.analyze()
+        db.commit()
+        store.refresh()
+
+    elapsed = time.perf_counter() - start
+
+    return {'incremental': incremental, 'catalogue_rows': len(steam_data), 'imported_rows': len(rows), 'removed_rows': len(removed),
+            'batches': n_batches, 'object_triples': n_objs, 'data_triples': n_datas, 'seconds': elapsed,
+            'rows_per_second': len(rows) / elapsed if elapsed else 0.0,
+            'triples_per_second': (n_objs + n_datas) / elapsed if elapsed else 0.0}
+
+# Importazione da riga di comando:    python ontology_import.py [percorso_csv] [--full] [--batch-size=N]
+if __name__ == '__main__':
+    import json
+    import sys
+
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    options = dict(a[2:].split('=', 1) if '=' in a else (a[2:], '') for a in sys.argv[1:] if a.startswith('--'))
+    report = import_catalogue(args[0] if args else STEAM_CSV, batch_size=int(options.get('batch-size') or 5000),
+                              incremental='full' not in options)
+    print(json.dumps(report, indent=1))
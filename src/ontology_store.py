@@ -0,0 +1,245 @@
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+from owlready2 import DataPropertyClass, ObjectPropertyClass, Thing, ThingClass, World
+from owlready2.base import rdf_type
+
+from catalogue import CACHE_DIR, file_hash
+
+ONTOLOGY_OWL = 'dataset/Steam-Ontology.owl'
+
+# versione del formato del quadstore: va incrementata quando cambia il modo in cui viene popolato
+ONTOLOGY_VERSION = 1
+
+# ontologie già aperte in questa sessione, per percorso del file .owl
+LOADED = {}
+
+# - ONTOLOGIA PERSISTENTE E INDICIZZATA
+
+# Funzione che restituisce il percorso del quadstore SQLite relativo al file .owl indicato (la chiave è l'hash del file,
+# quindi se il file .owl cambia viene creato un nuovo quadstore)
+def quadstore_path(filename=ONTOLOGY_OWL, cache_dir=CACHE_DIR):
+
+    return os.path.join(cache_dir, f'ontology_v{ONTOLOGY_VERSION}_{file_hash(filename)}.sqlite3')
+
+# Funzione che apre l'ontologia in un quadstore owlready2 salvato su SQLite: il file .owl viene analizzato solo la prima volta,
+# poi le esecuzioni successive riaprono direttamente il quadstore. Accanto al quadstore un file json indica che il caricamento
+# è stato completato e memorizza l'IRI e il nome dell'ontologia. Restituisce il World e l'ontologia.
+def open_ontology(filename=ONTOLOGY_OWL, cache_dir=CACHE_DIR):
+
+    path = quadstore_path(filename, cache_dir)
+    meta_path = path + '.json'
+
+    if os.path.exists(meta_path) and os.path.exists(path):
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        world = World(filename=path, exclusive=False)
+        ontology = world.ontologies[meta['base_iri']]
+    else:
+        #quadstore assente o incompleto (caricamento interrotto): viene ricreato
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        world = World(filename=path, exclusive=False)
+        ontology = world.get_ontology('file://' + os.path.abspath(filename)).load()
+        world.save()
+        meta = {'base_iri': ontology.base_iri, 'name': ontology.name}
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    #stesso nome mostrato quando l'ontologia viene caricata dal file .owl
+    ontology.name = meta['name']
+
+    return world, ontology
+
+# Funzione che scompone una query congiuntiva scritta come lista di atomi, ad esempio
+# 'Game(?g), has_developer(?g, Valve), has_platform(?g, Windows)', nella lista delle coppie (predicato, termini).
+# I termini che iniziano con '?' sono variabili, gli altri sono nomi di individui.
+def parse_query(text):
+
+    atoms = [(predicate, [t.strip() for t in terms.split(',') if t.strip()]) for predicate, terms in re.findall(r'(\w+)\s*\(([^)]*)\)', text)]
+    if not atoms:
+        raise ValueError('Query non valida: ' + text)
+
+    return atoms
+
+# Ontologia aperta una sola volta con gli indici precalcolati, letti direttamente dalle tabelle SQLite del quadstore:
+# - instances: nome della classe -> storid degli individui della classe (comprese le sottoclassi)
+# - values: nome della proprietà d'oggetto -> storid del valore -> insieme degli storid degli individui che hanno quel valore
+# In questo modo le ricerche come "giochi con genere X / sviluppatore Y / piattaforma Z" sono accessi a dizionario e
+# intersezioni di insiemi di interi, invece di ontology.search annidate; solo i risultati vengono convertiti in individui.
+# Dopo aver aggiunto individui va chiamato refresh().
+class OntologyStore:
+
+    def __init__(self, world, ontology, cache_size=128):
+
+        self.world = world
+        self.ontology = ontology
+        self.refresh()
+
+        # query SPARQL preparate (LRU), per struttura della query: le costanti sono parametri, quindi
+        # la stessa query con individui diversi riusa il piano già compilato
+        self.prepared = OrderedDict()
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        # tempi di esecuzione (in secondi) per struttura della query e tempo dell'ultima query
+        self.latencies = {}
+        self.last_latency = None
+
+    # ricostruisce gli indici dal quadstore
+    def refresh(self):
+
+        db = self.world.graph.db
+
+        self.instances = {}
+        for cls in self.ontology.classes():
+            classes = [c.storid for c in cls.descendants()]
+            query = 'SELECT DISTINCT s FROM objs WHERE p=? AND o IN (%s)' % ','.join('?' * len(classes))
+            self.instances[cls.name] = {s for (s,) in db.execute(query, [rdf_type] + classes) if s > 0}
+
+        self.values = {}
+        for prop in self.ontology.object_properties():
+            index = self.values[prop.name] = {}
+            for subject, value in db.execute('SELECT s, o FROM objs WHERE p=?', (prop.storid,)):
+                index.setdefault(value, set()).add(subject)
+
+    # converte un insieme di storid negli individui corrispondenti, ordinati per nome
+    def individuals(self, storids):
+
+        return sorted((self.world._get_by_storid(s) for s in storids), key=lambda individual: individual.name)
+
+    # individui della classe indicata (lista vuota se la classe non esiste)
+    def instances_of(self, class_name):
+
+        return self.individuals(self.instances.get(class_name, ()))
+
+    # storid degli individui che hanno value (nome o individuo) come valore della proprietà d'oggetto indicata
+    def subjects(self, property_name, value):
+
+        if isinstance(value, str):
+            value = self.ontology[value]
+        if value is None:
+            return set()
+
+        return self.values.get(property_name, {}).get(value.storid, set())
+
+    # individui della classe indicata che soddisfano tutti i vincoli proprietà=valore, ordinati per nome.
+    # Gli insiemi vengono intersecati partendo dal più piccolo.
+    def search(self, class_name, **constraints):
+
+        sets = sorted([self.subjects(prop, value) for prop, value in constraints.items()] + [self.instances.get(class_name, set())], key=len)
+
+        return self.individuals(set.intersection(*sets))
+
+    # giochi con il genere, lo sviluppatore, la casa pubblicatrice e la piattaforma indicati (i vincoli a None vengono ignorati)
+    def games_with(self, genre=None, developer=None, publisher=None, platform=None):
+
+        constraints = {'has_genre': genre, 'has_developer': developer, 'has_publisher': publisher, 'has_platform': platform}
+
+        return self.search('Game', **{prop: value for prop, value in constraints.items() if value is not None})
+
+    # traduce gli atomi di una query congiuntiva in SPARQL: gli atomi con un termine sono classi (?x a Classe), quelli con due
+    # termini sono proprietà (?x proprietà ?y). Le costanti diventano parametri '??' e vengono restituite a parte.
+    # Una query senza variabili diventa un conteggio delle soluzioni (SELECT (COUNT(*) AS ?found)).
+    def to_sparql(self, atoms):
+
+        variables = []
+        parameters = []
+        patterns = []
+        for predicate, terms in atoms:
+            entity = self.ontology[predicate]
+            if len(terms) == 1:
+                valid = isinstance(entity, ThingClass)
+            else:
+                valid = len(terms) == 2 and isinstance(entity, (ObjectPropertyClass, DataPropertyClass))
+            if not valid:
+                raise ValueError(f'Predicato sconosciuto: {predicate}/{len(terms)}')
+
+            sparql_terms = []
+            for term in terms:
+                if term.startswith('?'):
+                    if term not in variables:
+                        variables.append(term)
+                    sparql_terms.append(term)
+                else:
+                    individual = self.ontology[term]
+                    if not isinstance(individual, Thing):
+                        raise ValueError('Individuo sconosciuto: ' + term)
+                    parameters.append(individual)
+                    sparql_terms.append('??')
+
+            if len(terms) == 1:
+                patterns.append(f'{sparql_terms[0]} a <{entity.iri}> .')
+            else:
+                patterns.append(f'{sparql_terms[0]} <{entity.iri}> {sparql_terms[1]} .')
+
+        where = 'WHERE { ' + ' '.join(patterns) + ' }'
+        if not variables:
+            return 'SELECT (COUNT(*) AS ?found) ' + where, variables, parameters
+
+        return f'SELECT DISTINCT {" ".join(variables)} ' + where, variables, parameters
+
+    # restituisce la query preparata per il testo SPARQL dato, dalla cache se già compilata
+    def prepare(self, sparql):
+
+        if sparql in self.prepared:
+            self.hits += 1
+            self.prepared.move_to_end(sparql)
+            return self.prepared[sparql]
+
+        self.misses += 1
+        prepared = self.prepared[sparql] = self.world.prepare_sparql(sparql)
+        if len(self.prepared) > self.cache_size:
+            self.prepared.popitem(last=False)
+
+        return prepared
+
+    # esegue una query congiuntiva (vedi parse_query) con il motore SPARQL di owlready2 e restituisce una lista di dizionari
+    # {variabile: individuo}; una query senza variabili restituisce [{}] se è vera e [] se è falsa.
+    # Il tempo di esecuzione viene registrato in latencies e in last_latency.
+    def query(self, text):
+
+        start = time.perf_counter()
+        sparql, variables, parameters = self.to_sparql(parse_query(text))
+        rows = self.prepare(sparql).execute(parameters)
+        if variables:
+            results = [dict(zip((v[1:] for v in variables), row)) for row in rows]
+        else:
+            results = [{}] if list(rows)[0][0] else []
+        self.last_latency = time.perf_counter() - start
+        self.latencies.setdefault(sparql, []).append(self.last_latency)
+
+        return results
+
+    # ricerca a faccette: individui della classe con i valori indicati per le proprietà d'oggetto, come query congiuntiva
+    # (es. faceted_query('Game', has_platform='Windows', has_developer='Valve', has_genre='Classic'))
+    def faceted_query(self, class_name='Game', **constraints):
+
+        text = ', '.join([f'{class_name}(?x)'] + [f'{prop}(?x, {value})' for prop, value in constraints.items()])
+
+        return [row['x'] for row in self.query(text)]
+
+    # statistiche della cache delle query preparate e latenza (in millisecondi) di ogni struttura di query
+    def query_info(self):
+
+        latencies = {sparql: {'runs': len(times), 'mean_ms': sum(times) / len(times) * 1000, 'last_ms': times[-1] * 1000}
+                     for sparql, times in self.latencies.items()}
+
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.prepared), 'maxsize': self.cache_size, 'latencies': latencies}
+
+# Funzione che restituisce l'ontologia indicizzata, aperta una sola volta per sessione (finché il file .owl non cambia)
+def get_ontology_store(filename=ONTOLOGY_OWL, cache_dir=CACHE_DIR):
+
+    stat = os.stat(filename)
+    loaded = LOADED.get(filename)
+    if loaded is not None and loaded['source'] == (stat.st_mtime, stat.st_size):
+        return loaded['store']
+
+    store = OntologyStore(*open_ontology(filename, cache_dir))
+    LOADED[filename] = {'source': (stat.st_mtime, stat.st_size), 'store': store}
+
+    return store
@@ -1,8 +1,13 @@
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 import sklearn
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.feature_extraction.text import TfidfVectorizer
-from scipy.stats import pearsonr
+
+from similarity import pearson_scores, top_k
+from catalogue import get_catalogue, get_name_index
+from tfidf_model import get_tfidf_model, load_tfidf_model, transform_rows
 
 #funzione che gestisce la comunicazione con l'utente, chiedendo di inserire le caratteristiche del gioco su cui vuole che venga fatta la recomendation
 def get_info():
@@ -20,55 +25,115 @@ def get_info():
 
     return users_data
 
-#funzione che legge il dataset iniziale, lo riduce, controlla se il gioco inserito dall'utente sia già presente o meno, se non lo è lo aggiunge,
-#vettorizza il dataset aggiornato, calcola la similarità del coseno, trova i 5 giochi più simili a quello indicato dall'utente, basandosi sulla sua posizione
-#nel dataframe utilizzando l'indice ottenuto e si salva gli indici
-def construct_recommendation(filename, users_data):
+#funzione che prende il catalogo condiviso (il csv viene letto una sola volta) e lo riduce alle colonne utilizzate dal recommender
+def load_steam_data(filename):
 
-    steam_data = pd.read_csv(filename)
-    steam_data['positivity_quote'] = steam_data['positive_ratings'] // steam_data['negative_ratings']
+    steam_data = get_catalogue(filename)
     steam_data['genres'] = steam_data['steamspy_tags']
     steam_data = steam_data[['name','release_date','developer','publisher','platforms','genres','positivity_quote', 'average_playtime','owners','price']].copy()
+    #le colonne categoriche del catalogo vengono riportate a stringhe per poterle concatenare in 'all_content'
+    for column in ['developer', 'publisher', 'platforms']:
+        steam_data[column] = steam_data[column].astype(object)
 
-    #controllo se l'elemento dato dall'utente si trova già nel dataset o meno, se non si trova, lo aggiungo all'inizio/fine. Mi salvo l'indice di cosa ha chiesto l'utente in ogni caso
-    control = 0
+    return steam_data
 
-    for name in steam_data['name']:
-        if users_data['name'][0] != name:
-            index = 0
-            control = 1
-        else:
-            index = steam_data.index[steam_data['name'] == name].values[0] #invece di Zelda metterai il gioco dato da input che si trova nel dataset
-            control = 0
-            break
+#funzione che legge il dataset iniziale, lo riduce, controlla se il gioco inserito dall'utente sia già presente o meno,
+#carica la matrice tfidf già costruita sul catalogo (la costruisce solo la prima volta), se il gioco non è presente trasforma solo la sua riga,
+#trova i 5 giochi più simili a quello indicato dall'utente e si salva gli indici (riferiti alle righe del dataset)
+def construct_recommendation(filename, users_data):
 
-    if control == 1:
-        steam_data = pd.concat([users_data,steam_data], ignore_index=True)
+    steam_data = load_steam_data(filename)
 
-    #creazione della categoria che conterrà le altre categorie per procedere alla vettorizzazione dei dati
-    steam_data['all_content'] = steam_data['name'] + ';' + steam_data['developer'] + ';' + steam_data['publisher'] + ';' + steam_data['platforms'] + ';' + steam_data['genres'] #definisci le categorie che vuoi usare e uniscile in una, per poter applicare il tf-idf
-    
-    #vettorizzazione
-    tfidf_matrix = vectorize_data(steam_data)
-    tfidf_matrix_array = tfidf_matrix.toarray()
+    #controllo, tramite l'indice dei nomi, se l'elemento dato dall'utente si trova già nel dataset o meno. Mi salvo l'indice di cosa ha chiesto l'utente in ogni caso
+    name_index = get_name_index(filename)
+    index = name_index.lookup(users_data['name'][0])
+    control = 1 if index is None else 0
 
-    print('\nInizio ricerca di giochi...')
+    #carico il modello tfidf del catalogo (vocabolario, idf e matrice in memory-map)
+    model = get_tfidf_model(filename, steam_data)
+    tfidf_matrix = model['matrix']
 
-    indices = pd.Series(steam_data['name'].index)
+    print('\nInizio ricerca di giochi...')
 
-    id = indices[index]
-    correlation = []
-    for i in range(len(tfidf_matrix_array)):
-        correlation.append(pearsonr(tfidf_matrix_array[id], tfidf_matrix_array[i])[0])
-    correlation = list(enumerate(correlation))
-    sorted_corr = sorted(correlation, reverse=True, key=lambda x: x[1])[1:6]
-    games_index = [i[0] for i in sorted_corr] #indici dei 5 giochi più simili a quello passato dall'utente
+    if control == 1:
+        #il gioco non è nel dataset: trasformo solo la riga dell'utente e non devo scartare nessun risultato
+        query = transform_rows(model, users_data)
+        offset = 0
+    else:
+        #il gioco è nel dataset: uso la sua riga e scarto la prima posizione, che è il gioco stesso
+        query = tfidf_matrix[index]
+        offset = 1
+
+    #correlazione di Pearson tra il gioco dell'utente e tutti gli altri, calcolata in un'unica operazione sulla matrice sparsa
+    correlation = pearson_scores(tfidf_matrix, query, stats=model['stats'])[0]
+    games_index = top_k(correlation, k=5, offset=offset) #indici dei 5 giochi più simili a quello passato dall'utente
 
     print('\n[5 giochi più simili a quello inserito trovati]')
     print('\nPassaggio alla analisi del modello...')
 
     return games_index
 
+#funzione che calcola la raccomandazione per un blocco di righe query: una sola moltiplicazione matrice sparsa-matrice sparsa
+#per tutto il blocco, poi la selezione dei k migliori riga per riga. offsets indica per ogni query quante posizioni scartare
+#(1 se la query è un gioco del catalogo, per non restituire il gioco stesso, 0 altrimenti)
+def recommend_block(model, query_block, offsets, k=5):
+
+    correlation = pearson_scores(model['matrix'], query_block, stats=model['stats'])
+
+    return [top_k(row, k=k, offset=offset) for row, offset in zip(correlation, offsets)]
+
+#funzione eseguita dai processi del pool: ogni processo apre l'artefatto tfidf in memory-map invece di ricevere la matrice
+def recommend_block_from_path(path, query_block, offsets, k=5):
+
+    return recommend_block(load_tfidf_model(path), query_block, offsets, k)
+
+#funzione non interattiva che calcola i k giochi più simili per molte query insieme.
+#queries può essere: None (tutti i giochi del catalogo), una lista di nomi, oppure un dataframe con le colonne di get_info()
+#(name, developer, publisher, platforms, genres); le righe del dataframe il cui nome non è nel dataset vengono trasformate col vocabolario salvato.
+#Le query vengono elaborate a blocchi di block_size righe per limitare la memoria (ogni blocco occupa block_size x n_giochi float);
+#con n_jobs > 1 i blocchi vengono distribuiti su un pool di processi.
+#Restituisce, nell'ordine delle query, la lista degli indici dei giochi più simili (lista vuota per i nomi non trovati).
+def recommend_batch(filename, queries=None, k=5, block_size=1024, n_jobs=1):
+
+    steam_data = load_steam_data(filename)
+    model = get_tfidf_model(filename, steam_data)
+    tfidf_matrix = model['matrix']
+
+    if queries is None:
+        names = list(steam_data['name'])
+        positions = list(range(len(steam_data)))
+    else:
+        names = list(queries['name']) if isinstance(queries, pd.DataFrame) else list(queries)
+        name_index = get_name_index(filename)
+        positions = [name_index.lookup(name) for name in names]
+
+    known = [i for i, position in enumerate(positions) if position is not None]
+    unknown = [i for i, position in enumerate(positions) if position is None]
+
+    #righe query: quelle dei giochi del catalogo vengono prese dalla matrice, le altre vengono trasformate
+    blocks = [tfidf_matrix[[positions[i] for i in known]]]
+    order = known
+    offsets = [1] * len(known)
+    if unknown and isinstance(queries, pd.DataFrame):
+        blocks.append(transform_rows(model, queries.iloc[unknown]))
+        order = known + unknown
+        offsets += [0] * len(unknown)
+    query_matrix = sp.vstack(blocks).tocsr()
+
+    starts = range(0, len(order), block_size)
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futures = [pool.submit(recommend_block_from_path, model['path'], query_matrix[s:s + block_size], offsets[s:s + block_size], k) for s in starts]
+            neighbours = [games for future in futures for games in future.result()]
+    else:
+        neighbours = [games for s in starts for games in recommend_block(model, query_matrix[s:s + block_size], offsets[s:s + block_size], k)]
+
+    games_index = [[] for _ in names]
+    for i, games in zip(order, neighbours):
+        games_index[i] = games
+
+    return games_index
+
 #funzione che prende il dataframe ridotto e aggiornato e lo vettorizza per crearsi una matrice tfidf
 def vectorize_data(steam_data):
 
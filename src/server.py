@@ -0,0 +1,312 @@
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from catalogue import STEAM_CSV, get_catalogue, get_name_index
+from classification_validation import load_star_classifier, predict_with_proba
+from knowledge_base import LikingScorer, build_dataframe, load_kb
+from recommender_system import load_steam_data, recommend_block
+from tfidf_model import get_tfidf_model, transform_rows
+
+# limiti superiori (in millisecondi) dei bucket degli istogrammi di latenza; l'ultimo bucket raccoglie il resto
+LATENCY_BUCKETS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+# query della knowledge base: predicato(termine, ...), con termini semplici (senza virgole, parentesi, apici e spazi)
+# oppure tra doppi apici (vedi fact_store.quote_term)
+KB_TERM = r'\s*(?:"(?:[^"\\]|\\.)*"|[^\s,()"]+)\s*'
+KB_QUERY = re.compile(rf'\s*(\w+)\s*\({KB_TERM}(?:,{KB_TERM})*\)\s*')
+
+# - SERVIZIO HTTP/JSON
+
+# Errore per le risorse non trovate (risposta 404)
+class NotFound(LookupError):
+    pass
+
+# Errore per i giochi non presenti nel catalogo
+class GameNotFound(NotFound):
+    pass
+
+# Istogramma della latenza delle richieste di un endpoint (condiviso tra i thread, quindi protetto da un lock)
+class LatencyHistogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds, error=False):
+
+        position = int(np.searchsorted(self.buckets, seconds * 1000, side='left'))
+        with self.lock:
+            self.counts[position] += 1
+            self.total += seconds
+            self.errors += error
+
+    def snapshot(self):
+
+        with self.lock:
+            count = sum(self.counts)
+            labels = [f'<={b}ms' for b in self.buckets] + [f'>{self.buckets[-1]}ms']
+            return {'count': count, 'errors': self.errors, 'mean_ms': self.total / count * 1000 if count else 0.0,
+                    'buckets': dict(zip(labels, self.counts))}
+
+# Servizio che carica una sola volta catalogo, matrice tfidf, indice dei nomi, knowledge base, scorer della liking probability
+# e classificatore delle stelle, e risponde alle richieste degli endpoint. Ogni metodo riceve i parametri della richiesta
+# (dizionario) e restituisce un oggetto serializzabile in JSON; ValueError = richiesta non valida, GameNotFound = gioco non trovato.
+class SteamService:
+
+    def __init__(self, filename=STEAM_CSV):
+
+        start = time.perf_counter()
+        self.filename = filename
+
+        self.steam_data = load_steam_data(filename)
+        self.model = get_tfidf_model(filename, self.steam_data)
+        self.name_index = get_name_index(filename)
+
+        self.kb_data = build_dataframe(filename)
+        self.kb = load_kb(self.kb_data, filename)
+        #le risposte della knowledge base passano da una cache condivisa: una query alla volta
+        self.kb_lock = threading.Lock()
+        self.scorer = LikingScorer(self.kb_data)
+
+        self.star_model = load_star_classifier(filename)
+        catalogue = get_catalogue(filename)
+        self.star_features = catalogue[self.star_model['metadata']['features']]
+        self.stars = catalogue['star'].to_numpy()
+
+        self.startup_time = time.perf_counter() - start
+
+    # posizione del gioco nel catalogo, oppure GameNotFound
+    def position(self, name):
+
+        position = self.name_index.lookup(name)
+        if position is None:
+            raise GameNotFound('Gioco non trovato: ' + str(name))
+
+        return position
+
+    # descrizione dei giochi nelle posizioni indicate
+    def describe(self, positions):
+
+        rows = self.steam_data.iloc[positions]
+
+        return [{'position': int(p), 'name': row['name'], 'genres': row['genres'], 'developer': row['developer'], 'price': float(row['price'])}
+                for p, (_, row) in zip(positions, rows.iterrows())]
+
+    # /recommend: name (e, per un gioco non presente nel catalogo, developer, publisher, platforms, genres), k
+    def recommend(self, params):
+
+        name = required(params, 'name')
+        k = positive(params.get('k', 5), 'k')
+
+        position = self.name_index.lookup(name)
+        if position is not None:
+            query, offset = self.model['matrix'][[position]], 1
+        elif all(field in params for field in ('developer', 'publisher', 'platforms', 'genres')):
+            users_data = pd.DataFrame({field: [params[field]] for field in ('name', 'developer', 'publisher', 'platforms', 'genres')})
+            query, offset = transform_rows(self.model, users_data), 0
+        else:
+            raise GameNotFound('Gioco non trovato: ' + name + " (per un gioco nuovo servono developer, publisher, platforms e genres)")
+
+        games_index = recommend_block(self.model, query, [offset], k)[0]
+
+        return {'name': name, 'in_catalogue': position is not None, 'recommendations': self.describe(games_index)}
+
+    # /kb/query: q = query in stile Prolog, ad esempio has_price(X, portal) o has_price(X, "warhammer40,000:dawnofwar")
+    def kb_query(self, params):
+
+        expr = required(params, 'q')
+        match = KB_QUERY.fullmatch(expr)
+        if match is None:
+            raise ValueError('Query non valida: ' + expr)
+        predicate = match.group(1)
+        if predicate not in self.kb.facts and predicate not in self.kb.rules:
+            raise NotFound('Predicato sconosciuto: ' + predicate)
+
+        with self.kb_lock:
+            answers = self.kb.query(expr)
+
+        return {'query': expr, 'answers': answers}
+
+    # /liking: liked (gioco piaciuto), work_hours, e new (uno o più giochi) oppure k (i k giochi con probabilità più alta)
+    def liking(self, params):
+
+        liked = required(params, 'liked')
+        work_hours = float(required(params, 'work_hours'))
+
+        candidates = params.get('new')
+        if isinstance(candidates, str):
+            candidates = [candidates]
+        k = positive(params.get('k', 10), 'k')
+
+        #senza giochi nuovi vengono valutati tutti gli altri giochi del catalogo (il gioco piaciuto avrebbe sempre il 100%)
+        try:
+            prob = self.scorer.score_games(liked, work_hours, candidates, self.name_index, exclude_liked=True)
+        except KeyError as error:
+            raise GameNotFound(error.args[0])
+        if candidates is None:
+            prob = prob.head(k)
+
+        return {'liked': liked, 'work_hours': work_hours, 'probabilities': [{'name': n, 'probability': float(p)} for n, p in prob.items()]}
+
+    # /predict-star: name (uno o più giochi del catalogo)
+    def predict_star(self, params):
+
+        names = required(params, 'name')
+        names = [names] if isinstance(names, str) else list(names)
+        positions = [self.position(name) for name in names]
+
+        labels, proba = predict_with_proba(self.star_model, self.star_model['scaler'].transform(self.star_features.iloc[positions]))
+        classes = self.star_model['knn'].classes_
+
+        return {'predictions': [{'name': name, 'predicted_star': int(label), 'star': int(self.stars[p]),
+                                 'probabilities': {str(int(c)): float(v) for c, v in zip(classes, row)}}
+                                for name, p, label, row in zip(names, positions, labels, proba)]}
+
+# Funzione che restituisce un parametro obbligatorio della richiesta, oppure ValueError
+def required(params, name):
+
+    if name not in params or params[name] in ('', None):
+        raise ValueError('Parametro mancante: ' + name)
+
+    return params[name]
+
+# Funzione che converte un parametro in un intero maggiore di zero, oppure ValueError
+def positive(value, name):
+
+    value = int(value)
+    if value < 1:
+        raise ValueError(f'Il parametro {name} deve essere maggiore di zero')
+
+    return value
+
+# Gestore delle richieste: i parametri arrivano dalla query string (GET) o da un oggetto JSON nel corpo (POST)
+class RequestHandler(BaseHTTPRequestHandler):
+
+    ENDPOINTS = {'/recommend': 'recommend', '/kb/query': 'kb_query', '/liking': 'liking', '/predict-star': 'predict_star'}
+
+    def do_GET(self):
+
+        url = urlparse(self.path)
+        params = {key: values[0] if len(values) == 1 else values for key, values in parse_qs(url.query).items()}
+        self.handle_endpoint(url.path, params)
+
+    def do_POST(self):
+
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            params = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_json(400, {'error': 'JSON non valido'})
+            return
+        self.handle_endpoint(url.path, params)
+
+    def handle_endpoint(self, path, params):
+
+        if path == '/metrics':
+            self.send_json(200, self.server.metrics_snapshot())
+            return
+        if path not in self.ENDPOINTS:
+            self.send_json(404, {'error': 'Endpoint non trovato: ' + path})
+            return
+
+        start = time.perf_counter()
+        status = 200
+        try:
+            body = getattr(self.server.service, self.ENDPOINTS[path])(params)
+        except NotFound as error:
+            status, body = 404, {'error': str(error)}
+        except (ValueError, TypeError) as error:
+            status, body = 400, {'error': str(error)}
+        except Exception as error:
+            status, body = 500, {'error': repr(error)}
+        self.server.metrics[path].record(time.perf_counter() - start, error=status != 200)
+
+        self.send_json(status, body)
+
+    def send_json(self, status, body):
+
+        data = json.dumps(body, default=lambda o: o.item() if hasattr(o, 'item') else str(o)).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+# Server HTTP che serve le richieste con un pool di workers thread (invece di un thread nuovo per ogni connessione):
+# il numero di richieste elaborate contemporaneamente è limitato e i thread vengono riutilizzati
+class PooledHTTPServer(HTTPServer):
+
+    def __init__(self, address, service, workers=8, verbose=False):
+
+        super().__init__(address, RequestHandler)
+        self.service = service
+        self.verbose = verbose
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.metrics = {path: LatencyHistogram() for path in RequestHandler.ENDPOINTS}
+
+    def process_request(self, request, client_address):
+
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    # come ThreadingMixIn.process_request_thread
+    def process_request_thread(self, request, client_address):
+
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def metrics_snapshot(self):
+
+        return {'startup_seconds': self.service.startup_time, 'endpoints': {path: h.snapshot() for path, h in self.metrics.items()}}
+
+    def server_close(self):
+
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+# Funzione che crea il server: i dati vengono caricati una sola volta, prima di accettare richieste
+def create_server(filename=STEAM_CSV, host='127.0.0.1', port=8000, workers=8, verbose=False):
+
+    return PooledHTTPServer((host, port), SteamService(filename), workers, verbose)
+
+# Avvio da riga di comando:    python server.py [percorso_csv] [--port=8000] [--workers=8] [--verbose]
+# Esempi:  curl 'http://127.0.0.1:8000/recommend?name=Portal&k=5'
+#          curl 'http://127.0.0.1:8000/kb/query?q=has_price(X,portal)'
+#          curl -X POST -d '{"liked": "Portal", "new": ["Half-Life"], "work_hours": 8}' http://127.0.0.1:8000/liking
+#          curl 'http://127.0.0.1:8000/predict-star?name=Portal'
+#          curl 'http://127.0.0.1:8000/metrics'
+if __name__ == '__main__':
+    import sys
+
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    options = dict(a[2:].split('=', 1) if '=' in a else (a[2:], '') for a in sys.argv[1:] if a.startswith('--'))
+    server = create_server(args[0] if args else STEAM_CSV, port=int(options.get('port') or 8000),
+                           workers=int(options.get('workers') or 8), verbose='verbose' in options)
+    print('Servizio avviato su http://%s:%d (dati caricati in %.2f secondi)' % (*server.server_address, server.service.startup_time))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
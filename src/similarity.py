@@ -0,0 +1,98 @@
+import numpy as np
+import scipy.sparse as sp
+
+# - MOTORE DI SIMILARITÀ
+
+# Funzione che calcola, una volta sola, le statistiche per riga della matrice tfidf necessarie alla correlazione di Pearson:
+# la somma dei valori e la somma dei quadrati di ogni riga. Possono essere riutilizzate per tutte le query sulla stessa matrice.
+def row_statistics(tfidf_matrix):
+
+    tfidf_matrix = sp.csr_matrix(tfidf_matrix)
+    sums = np.asarray(tfidf_matrix.sum(axis=1)).ravel()
+    sq_sums = np.asarray(tfidf_matrix.multiply(tfidf_matrix).sum(axis=1)).ravel()
+
+    return sums, sq_sums
+
+# Funzione che calcola la correlazione di Pearson tra una (o più) righe query e tutte le righe della matrice tfidf, senza densificarla.
+# La centratura sulla media viene gestita analiticamente:
+# cov(q, x) = q·x - sum(q)*sum(x)/m ; var(x) = x·x - sum(x)^2/m ; corr = cov / sqrt(var(q)*var(x))
+# dove m è il numero di colonne. Restituisce un array (n_query, n_righe); le righe a varianza nulla hanno correlazione -inf.
+def pearson_scores(tfidf_matrix, query, stats=None):
+
+    tfidf_matrix = sp.csr_matrix(tfidf_matrix)
+    query = sp.csr_matrix(query)
+    n_cols = tfidf_matrix.shape[1]
+
+    if stats is None:
+        stats = row_statistics(tfidf_matrix)
+    sums, sq_sums = stats
+    q_sums, q_sq_sums = row_statistics(query)
+
+    dot = (query @ tfidf_matrix.T).toarray()
+
+    cov = dot - np.outer(q_sums, sums) / n_cols
+    var = sq_sums - sums ** 2 / n_cols
+    q_var = q_sq_sums - q_sums ** 2 / n_cols
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = cov / np.sqrt(np.outer(q_var, var))
+    scores[~np.isfinite(scores)] = -np.inf
+
+    return scores
+
+# Funzione che calcola la similarità del coseno tra una (o più) righe query e tutte le righe della matrice tfidf.
+# Le righe prodotte dal TfidfVectorizer sono già normalizzate (norma l2), quindi basta il prodotto scalare;
+# passando normalize=True le norme vengono calcolate esplicitamente.
+def cosine_scores(tfidf_matrix, query, normalize=False):
+
+    tfidf_matrix = sp.csr_matrix(tfidf_matrix)
+    query = sp.csr_matrix(query)
+
+    scores = (query @ tfidf_matrix.T).toarray()
+
+    if normalize:
+        norms = np.sqrt(np.asarray(tfidf_matrix.multiply(tfidf_matrix).sum(axis=1)).ravel())
+        q_norms = np.sqrt(np.asarray(query.multiply(query).sum(axis=1)).ravel())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = scores / np.outer(q_norms, norms)
+        scores[~np.isfinite(scores)] = 0.0
+
+    return scores
+
+# Funzione che calcola la distanza euclidea tra una (o più) righe query e tutte le righe della matrice tfidf, senza costruire
+# la matrice N×N delle distanze: ||q - x||^2 = ||q||^2 + ||x||^2 - 2 q·x, con ||x||^2 già disponibile come sq_sums in row_statistics.
+# Restituisce un array (n_query, n_righe); per ordinare dal più vicino basta passare -distanze a top_k.
+def euclidean_scores(tfidf_matrix, query, sq_sums=None):
+
+    tfidf_matrix = sp.csr_matrix(tfidf_matrix)
+    query = sp.csr_matrix(query)
+
+    if sq_sums is None:
+        sq_sums = row_statistics(tfidf_matrix)[1]
+    q_sq_sums = row_statistics(query)[1]
+
+    squared = q_sq_sums[:, None] + sq_sums[None, :] - 2 * (query @ tfidf_matrix.T).toarray()
+
+    #errori di arrotondamento possono dare valori leggermente negativi
+    return np.sqrt(np.maximum(squared, 0.0))
+
+# Funzione che seleziona gli indici con punteggio più alto, senza ordinare l'intero vettore.
+# Con np.argpartition sceglie i primi offset+k candidati, includendo tutti i pari merito sul valore di soglia,
+# e solo questi vengono ordinati (punteggio decrescente, a parità di punteggio indice crescente) in modo da
+# restituire esattamente lo stesso ordine di sorted(..., reverse=True)[offset:offset+k].
+# Con offset=1 si scarta la prima posizione, che corrisponde al gioco usato come query.
+def top_k(scores, k=5, offset=1):
+
+    scores = np.asarray(scores)
+    if scores.ndim == 2:
+        return [top_k(row, k, offset) for row in scores]
+
+    n = offset + k
+    if n >= len(scores):
+        candidates = np.arange(len(scores))
+    else:
+        threshold = scores[np.argpartition(-scores, n - 1)[n - 1]]
+        candidates = np.flatnonzero(scores >= threshold)
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][offset:n].tolist()
@@ -0,0 +1,112 @@
+import json
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from catalogue import CACHE_DIR, load_catalogue
+from similarity import row_statistics
+
+# - MODELLO TF-IDF PERSISTENTE
+
+# Funzione che crea la colonna 'all_content' che contiene le categorie su cui viene applicato il tf-idf
+def build_content(steam_data):
+
+    return steam_data['name'] + ';' + steam_data['developer'] + ';' + steam_data['publisher'] + ';' + steam_data['platforms'] + ';' + steam_data['genres']
+
+# Funzione che restituisce la cartella in cui viene salvato l'artefatto relativo al csv indicato
+# (l'hash viene preso dal catalogo caricato, quindi il csv non viene riletto a ogni richiesta)
+def model_dir(filename, cache_dir=CACHE_DIR):
+
+    return os.path.join(cache_dir, 'tfidf_' + load_catalogue(filename, cache_dir)['source']['hash'])
+
+# Funzione che esegue il fit del TfidfVectorizer sull'intero catalogo una sola volta e salva su disco:
+# il vocabolario (json), i pesi idf e la matrice sparsa in formato csr, un array .npy per ogni componente,
+# in modo che possano essere caricati in memory-map. Salva anche le statistiche per riga usate da Pearson.
+def build_tfidf_model(filename, steam_data, cache_dir=CACHE_DIR):
+
+    vectorizer = TfidfVectorizer(analyzer='word')
+    tfidf_matrix = vectorizer.fit_transform(build_content(steam_data)).tocsr()
+
+    vocabulary = {term: int(i) for term, i in vectorizer.vocabulary_.items()}
+
+    return save_tfidf_model(model_dir(filename, cache_dir), vocabulary, vectorizer.idf_, tfidf_matrix)
+
+# Funzione che salva vocabolario, idf, matrice csr e statistiche per riga nella cartella indicata
+def save_tfidf_model(path, vocabulary, idf, tfidf_matrix):
+
+    os.makedirs(path, exist_ok=True)
+    sums, sq_sums = row_statistics(tfidf_matrix)
+
+    with open(os.path.join(path, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+        json.dump(vocabulary, f)
+
+    np.save(os.path.join(path, 'idf.npy'), idf)
+    np.save(os.path.join(path, 'data.npy'), tfidf_matrix.data)
+    np.save(os.path.join(path, 'indices.npy'), tfidf_matrix.indices)
+    np.save(os.path.join(path, 'indptr.npy'), tfidf_matrix.indptr)
+    np.save(os.path.join(path, 'shape.npy'), np.array(tfidf_matrix.shape))
+    np.save(os.path.join(path, 'sums.npy'), sums)
+    np.save(os.path.join(path, 'sq_sums.npy'), sq_sums)
+
+    return path
+
+# Funzione che carica l'artefatto salvato: gli array della matrice vengono aperti in memory-map (mmap_mode='r'),
+# quindi non vengono letti interamente in memoria. Restituisce un dizionario con vocabolario, idf, matrice e statistiche.
+def load_tfidf_model(path):
+
+    with open(os.path.join(path, 'vocabulary.json'), encoding='utf-8') as f:
+        vocabulary = json.load(f)
+
+    load = lambda name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+    shape = tuple(int(x) for x in load('shape'))
+    tfidf_matrix = sp.csr_matrix((load('data'), load('indices'), load('indptr')), shape=shape, copy=False)
+
+    return {'path': path, 'vocabulary': vocabulary, 'idf': np.asarray(load('idf')), 'matrix': tfidf_matrix, 'stats': (load('sums'), load('sq_sums'))}
+
+# Funzione che restituisce il modello relativo al csv: se l'artefatto esiste già lo carica, altrimenti lo costruisce
+def get_tfidf_model(filename, steam_data, cache_dir=CACHE_DIR):
+
+    path = model_dir(filename, cache_dir)
+    if not os.path.exists(os.path.join(path, 'sq_sums.npy')):
+        build_tfidf_model(filename, steam_data, cache_dir)
+
+    return load_tfidf_model(path)
+
+# Funzione che trasforma delle nuove righe (ad esempio il gioco inserito dall'utente) usando vocabolario e idf salvati,
+# senza rifare il fit: conteggio dei termini, pesatura idf e normalizzazione l2, come fa il TfidfVectorizer.
+def transform_rows(model, steam_data):
+
+    counter = CountVectorizer(analyzer='word', vocabulary=model['vocabulary'])
+    counts = counter.transform(build_content(steam_data)).astype(np.float64)
+    tfidf = counts @ sp.diags(model['idf'])
+
+    return normalize(tfidf, norm='l2').tocsr()
+
+# colonne di build_content usate per misurare il drift del vocabolario: il nome è escluso, perché quasi ogni titolo
+# nuovo contiene parole mai viste e il drift misurerebbe solo questo (le parole nuove del nome vengono comunque ignorate
+# dalla trasformazione, come per i giochi non presenti nel catalogo)
+DRIFT_COLUMNS = ['developer', 'publisher', 'platforms', 'genres']
+
+# Funzione che misura quanto delle nuove righe il vocabolario salvato non riesce a rappresentare: la frazione delle parole
+# delle colonne DRIFT_COLUMNS (con lo stesso tokenizer del TfidfVectorizer) che non sono nel vocabolario
+def vocabulary_drift(model, steam_data):
+
+    analyzer = CountVectorizer(analyzer='word').build_analyzer()
+    content = steam_data[DRIFT_COLUMNS].astype(str).agg(';'.join, axis=1)
+    tokens = [token for text in content for token in analyzer(text)]
+    if not tokens:
+        return 0.0
+
+    return sum(token not in model['vocabulary'] for token in tokens) / len(tokens)
+
+# Build dell'artefatto da riga di comando:    python tfidf_model.py [percorso_csv]
+if __name__ == '__main__':
+    import sys
+    from recommender_system import load_steam_data
+
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'dataset/steam.csv'
+    print('Artefatto tf-idf salvato in:', build_tfidf_model(filename, load_steam_data(filename)))